@@ -2,9 +2,11 @@
 
 from os import environ
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, List, Optional
 
-from pydantic import BaseSettings
+from pydantic import BaseSettings, validator
+
+from app.constants import InputPipeline, Quantization, TrainingMode
 
 
 def get_env_var(key_name: str, data_type: Any, default: Optional[Any] = None):
@@ -31,6 +33,8 @@ class Settings(BaseSettings):
     """App settings."""
 
     app_prefix: str = "/api"
+    # Return the stage timings of modelling requests in a Server-Timing header
+    debug_timing_header: bool = False
     app_base_url: str = get_env_var("APP_BASE_URL", str)
     database_url = "{dialect}://{user}:{password}@{host}/{database_name}".format(
         dialect="postgresql",
@@ -40,8 +44,147 @@ class Settings(BaseSettings):
         port=environ["DB_PORT"],
         database_name=environ["DB_NAME"],
     )
+    async_database_url = "{dialect}://{user}:{password}@{host}/{database_name}".format(
+        dialect="postgresql+asyncpg",
+        user=environ["DB_USER"],
+        password=environ["DB_PASSWORD"],
+        host=environ["DB_HOST"],
+        port=environ["DB_PORT"],
+        database_name=environ["DB_NAME"],
+    )
+
+    # Connection pool of each database engine
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+
+    data_dir: Path = Path("data")
+
+    # Create the database and its tables on startup, can be disabled where the
+    # schema is managed by migrations
+    setup_database: bool = True
+
+    # Pretrained weights, read from the seed directory when it holds them, e.g.
+    # on offline machines, and otherwise downloaded into the data dir. The md5
+    # is the digest Keras publishes for the InceptionV3 notop weights file.
+    pretrained_weights_dir: Optional[str] = None
+    pretrained_weights_sha256: Optional[str] = None
+    pretrained_weights_md5: Optional[str] = "bcbd6486424b2319ff4ef7d526e38f63"
+
+    # Loaded model cache
+    model_cache_size: int = 4
+    model_cache_max_bytes: int = 2 * 1024**3
+    model_cache_preload: int = 0
+
+    # Dummy batch sizes run through every model version when it is loaded. TFLite
+    # models keep an interpreter allocated per size and run batches in chunks of
+    # these sizes, each size costs an interpreter's memory. Versions listed in
+    # warmup_versions have to be warm before the service is ready, a version
+    # failing to load is retried with doubling delays and reported as a
+    # readiness error once the attempts are used up, without blocking readiness.
+    warmup_batch_sizes: List[int] = [32, 8, 1]
+    warmup_versions: List[str] = []
+    warmup_attempts: int = 5
+    warmup_retry_seconds: float = 2
+
+    # Model versions are cached in memory and checked for new versions trained
+    # by other workers at this interval, and when an unknown version is
+    # requested at most at the miss interval
+    version_poll_seconds: float = 5
+    version_miss_refresh_seconds: float = 1
+
+    # Prediction micro-batching, a max batch size of 1 disables coalescing
+    predict_max_batch_size: int = 32
+    predict_max_wait_ms: float = 5
+    # Batchers without requests for this long stop their worker and are dropped
+    predict_batcher_idle_seconds: float = 60
+
+    # Admission control per endpoint, requests beyond the concurrency limit
+    # wait in a queue of bounded length. A full queue is answered with 429 and
+    # a request that waited longer than the queue timeout with 503.
+    predict_max_concurrency: int = 64
+    predict_max_queued: int = 256
+    predict_batch_max_concurrency: int = 2
+    predict_batch_max_queued: int = 8
+    evaluate_max_concurrency: int = 2
+    evaluate_max_queued: int = 4
+    train_max_concurrency: int = 2
+    train_max_queued: int = 4
+    admission_queue_timeout_seconds: float = 10
+    admission_retry_after_seconds: int = 5
+
+    # Executor pools for blocking work, evaluations run on a pool of
+    # evaluate_max_concurrency threads
+    inference_pool_workers: int = 4
+    training_pool_workers: int = 1
+    training_pool_processes: bool = True
+
+    # Training job queue, running jobs report progress and a heartbeat, jobs
+    # without a heartbeat for the stale time are failed on startup. Submissions
+    # beyond the max queued jobs are answered with 429.
+    training_job_workers: int = 1
+    training_job_max_queued: int = 16
+    training_job_poll_seconds: float = 5
+    training_progress_seconds: float = 5
+    training_job_heartbeat_seconds: float = 30
+    training_job_stale_seconds: float = 600
+
+    input_pipeline: str = InputPipeline.TF_DATA
+    # Keep the decoded training images in memory after the first epoch, only
+    # for datasets that fit in memory
+    input_cache: bool = False
+
+    # Zip ingestion, streaming reads images straight out of uploaded archives
+    stream_zip_ingestion: bool = True
+    max_zip_members: int = 100_000
+    max_zip_uncompressed_bytes: int = 4 * 1024**3
+    max_zip_compression_ratio: int = 100
+
+    # Prediction result cache
+    prediction_cache_size: int = 10_000
+    prediction_cache_ttl_seconds: float = 24 * 3600
+    prediction_cache_persist: bool = False
+
+    # Largest image accepted by /predict, which reads it into memory
+    max_predict_upload_bytes: int = 20 * 1024**2
+
+    # Keep a content addressed copy of every image sent to /predict
+    archive_predict_images: bool = False
+
+    # Prediction history is buffered and written in batches, records beyond the
+    # buffer size are dropped and records failing to write are dead-lettered
+    audit_batch_size: int = 500
+    audit_flush_seconds: float = 1
+    audit_max_buffered: int = 100_000
+    audit_max_attempts: int = 10
+    audit_synchronous: bool = False
+
+    # Training mode and bottleneck feature cache
+    training_mode: str = TrainingMode.FULL
+    # Defaults to the features directory in the data dir. Least recently used
+    # entries are deleted after a training once the cache exceeds the max bytes.
+    feature_cache_dir: Optional[Path] = None
+    feature_cache_max_bytes: int = 10 * 1024**3
+    feature_augmentation_copies: int = 0
+
+    # Optimized TFLite export, served instead of the SavedModel when enabled and
+    # its accuracy is within the allowed drop of the original
+    quantization: str = Quantization.NONE
+    quantization_calibration_size: int = 100
+    quantization_max_accuracy_drop: float = 0.01
+    serve_quantized: bool = False
+    # Serve from the frozen float TFLite model saved next to each SavedModel
+    serve_frozen_graph: bool = True
+    # Serve every version from one resident backbone plus its own head
+    shared_backbone: bool = False
+    # Run frozen models on weights mapped read-only from disk, so worker
+    # processes share their pages, instead of XNNPACK's faster private copy
+    mmap_weights: bool = False
 
-    data_dir = Path("data")
+    @validator("feature_cache_dir", always=True)
+    def default_feature_cache_dir(cls, value, values):
+        return value or values["data_dir"] / "features"
 
 
 settings = Settings()
@@ -11,10 +11,78 @@ class Operations:
     PREDICT = "predict"
 
 
+class Endpoint:
+    """Modelling endpoint names used in metrics."""
+
+    TRAIN = "train"
+    EVALUATE = "evaluate"
+    PREDICT = "predict"
+    PREDICT_BATCH = "predict_batch"
+
+
+class TrainingMode:
+    """Training modes."""
+
+    # Train the full model end to end on augmented images
+    FULL = "full"
+    # Train the head on cached feature layer activations
+    BOTTLENECK = "bottleneck"
+
+
+class InputPipeline:
+    """Image input pipelines."""
+
+    # keras ImageDataGenerator, decodes and augments in a single thread
+    GENERATOR = "generator"
+    # tf.data with parallel decoding, caching and vectorized augmentation
+    TF_DATA = "tf.data"
+
+
+class Quantization:
+    """Post-training quantization of exported inference models."""
+
+    NONE = "none"
+    # Weights stored as float16, computation stays in float32
+    FLOAT16 = "float16"
+    # Weights and activations in int8, calibrated on a training sample
+    INT8 = "int8"
+
+
+class JobStatus:
+    """Training job states."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class StartupStep:
+    """Startup steps the service waits for before reporting ready."""
+
+    DATABASE = "database"
+    MODEL_VERSIONS = "model_versions"
+    # Modelling modules imported and configured versions warmed up
+    MODELS = "models"
+
+
 class ResponseMessage(Enum):
     """Response messages."""
 
     TRAINING_SUCCESS = "Training Successful"
+    TRAINING_QUEUED = "Training job queued"
+    JOB_DOESNT_EXIST = "The training job: '{job_id}' doesn't exist."
+    JOB_INTERRUPTED = (
+        "Training was interrupted by a worker restart, please submit it again."
+    )
+    UNREADABLE_IMAGE = "Unreadable image"
+    UPLOAD_TOO_LARGE = "Uploaded file exceeds the limit of {max_bytes} bytes."
+    INVALID_ARCHIVE = "Invalid zip archive! {error}"
+    INVALID_CURSOR = "Invalid history cursor"
+    TOO_MANY_REQUESTS = "Too many {endpoint} requests queued, retry later."
+    TOO_MANY_TRAINING_JOBS = "{queued} training jobs are waiting already, retry later."
+    OVERLOADED = "Timed out waiting for a free {endpoint} slot, retry later."
+    MODEL_VERSION_EXISTS = "The model version: '{model_version}' already exists."
     MODEL_DOESNT_EXIST = "The model version: '{model_version}' doesn't exist. Please use an available model version."
 
 
@@ -22,6 +90,9 @@ class APIConstants(Enum):
     """Api constants"""
 
     UPLOAD_CHUNK_SIZE = 1024 * 1024
+    HISTORY_PAGE_SIZE = 100
+    HISTORY_MAX_PAGE_SIZE = 1000
+    HISTORY_STREAM_CHUNK_SIZE = 1000
 
 
 class ModelConstants(Enum):
@@ -30,6 +101,14 @@ class ModelConstants(Enum):
     INPUT_IMAGE_SHAPE = (150, 150, 3)
     PRETRAINED_WEIGHTS = "https://storage.googleapis.com/mledu-datasets/inception_v3_weights_tf_dim_ordering_tf_kernels_notop.h5"
     BATCH_SIZE = 40
+    EVAL_BATCH_SIZE = 128
+    PREDICT_BATCH_SIZE = 64
+    EPOCHS = 4
+    STEPS_PER_EPOCH = 10
+    FEATURE_LAYER = "mixed7"
+    IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+    # Decoded images, 256 images of 150x150x3 float32 take about 70 MB
+    SHUFFLE_BUFFER_SIZE = 256
 
 
 # Image data generator parameter
@@ -0,0 +1,39 @@
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.datamodel import models
+
+
+async def create(
+    db: AsyncSession,
+    model: Any,
+    data_dict: Any,
+    commit: bool = True,
+) -> models.Base:
+    db_record = model(**data_dict)
+    db.add(db_record)
+    await db.flush()
+
+    if commit:
+        await db.commit()
+        await db.refresh(db_record)
+
+    return db_record
+
+
+async def get_or_create(
+    db: AsyncSession,
+    model: Any,
+    data_dict: Any,
+    commit: bool = True,
+) -> models.Base:
+
+    result = await db.execute(select(model).filter_by(**data_dict))
+    db_record = result.scalars().first()
+
+    if db_record:
+        return db_record
+
+    return await create(db, model, data_dict, commit)
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, List
 
 from sqlalchemy.orm import Session
 
@@ -43,3 +43,15 @@ def get_all(db: Session, model: Any, **filters: Any) -> Any:
         query = query.filter_by(**filters)
 
     return query.all()
+
+
+def bulk_create(
+    db: Session,
+    model: Any,
+    data_dicts: List[Any],
+    commit: bool = True,
+) -> None:
+    db.bulk_insert_mappings(model, data_dicts)
+
+    if commit:
+        db.commit()
@@ -1,8 +1,10 @@
 """Utility functions for database connections."""
 
 from logging import getLogger
+from typing import Any, Dict
 
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy_utils.functions import create_database, database_exists
 
@@ -11,7 +13,32 @@ from app.datamodel.models import Base
 
 logger = getLogger(__name__)
 
-engine = create_engine(settings.database_url, future=True, pool_pre_ping=True)
+
+def pool_options() -> Dict[str, Any]:
+    """Pool sizing options shared by the sync and async engines."""
+    return dict(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+    )
+
+
+engine = create_engine(
+    settings.database_url,
+    future=True,
+    pool_pre_ping=True,
+    **pool_options(),
+)
+
+async_engine = create_async_engine(
+    settings.async_database_url,
+    pool_pre_ping=True,
+    **pool_options(),
+)
+AsyncSessionLocal = sessionmaker(
+    async_engine, class_=AsyncSession, expire_on_commit=False
+)
 
 
 def setup_db() -> None:
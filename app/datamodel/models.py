@@ -1,8 +1,19 @@
 from datetime import datetime
 from typing import Any
 
-from sqlalchemy import Column, DateTime, ForeignKey, MetaData, String, func, text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import declarative_base
 
 metadata = MetaData()
@@ -19,7 +30,7 @@ class ImageModel(Base):
         UUID(as_uuid=True), primary_key=True, server_default=text("uuid_generate_v4()")
     )
     version = Column(String, nullable=False, unique=True)
-    class_map = Column(String, nullable=False)
+    class_map = Column(JSONB, nullable=False)
     created_at = Column(
         DateTime,
         default=datetime.utcnow,
@@ -31,6 +42,11 @@ class ImageModel(Base):
 class Operation(Base):
 
     __tablename__ = "operation"
+    __table_args__ = (
+        # Keyset pagination of the history, newest first
+        Index("ix_operation_time_operation_uuid", "time", "operation_uuid"),
+        Index("ix_operation_model_uuid_time", "model_uuid", "time"),
+    )
 
     operation_uuid = Column(
         UUID(as_uuid=True), primary_key=True, server_default=text("uuid_generate_v4()")
@@ -58,7 +74,10 @@ class Predict(Base):
     output = Column(String, nullable=False)
 
     operation_uuid = Column(
-        UUID(as_uuid=True), ForeignKey("operation.operation_uuid"), nullable=False
+        UUID(as_uuid=True),
+        ForeignKey("operation.operation_uuid"),
+        nullable=False,
+        index=True,
     )
 
 
@@ -71,8 +90,60 @@ class Evaluate(Base):
     )
     data = Column(String)
     output = Column(String, nullable=False)
-    metrics = Column(String)
+    accuracy = Column(Float)
+    loss = Column(Float)
+    metrics = Column(JSONB)
 
     operation_uuid = Column(
-        UUID(as_uuid=True), ForeignKey("operation.operation_uuid"), nullable=False
+        UUID(as_uuid=True),
+        ForeignKey("operation.operation_uuid"),
+        nullable=False,
+        index=True,
+    )
+
+
+class TrainingJob(Base):
+    """Database table for queued and running training jobs."""
+
+    __tablename__ = "training_job"
+
+    job_uuid = Column(
+        UUID(as_uuid=True), primary_key=True, server_default=text("uuid_generate_v4()")
+    )
+    model_version = Column(String, nullable=False)
+    model_uuid = Column(UUID(as_uuid=True), nullable=False)
+    data = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+
+    epoch = Column(Integer)
+    step = Column(Integer)
+    loss = Column(Float)
+    error = Column(String)
+
+    created_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        server_default=func.timezone("UTC", func.current_timestamp()),
+        nullable=False,
+    )
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PredictionCacheEntry(Base):
+    """Database table for cached prediction results."""
+
+    __tablename__ = "prediction_cache"
+
+    model_uuid = Column(
+        UUID(as_uuid=True),
+        ForeignKey("image_model.image_model_uuid", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    image_hash = Column(String, primary_key=True)
+    output = Column(String, nullable=False)
+    created_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        server_default=func.timezone("UTC", func.current_timestamp()),
+        nullable=False,
     )
@@ -1,10 +1,11 @@
 """File to store api dependencies."""
 
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.datamodel.database import engine
+from app.datamodel.database import AsyncSessionLocal, engine
 
 
 def get_db() -> Generator[Session, None, None]:
@@ -16,3 +17,14 @@ def get_db() -> Generator[Session, None, None]:
         except Exception:
             session.rollback()
             raise
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Get async database session."""
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
@@ -3,14 +3,22 @@
 import os
 
 from fastapi import FastAPI
+from sqlalchemy.orm import Session
 
 from app.config import settings
-from app.datamodel.database import setup_db
+from app.constants import Endpoint, StartupStep
+from app.datamodel.database import async_engine, engine, setup_db
 from app.routers.modelling import model_route
 from app.routers.status import status_router
+from app.scripts.admission import AdmissionControl, admission_limiters
+from app.scripts.audit import audit_writer
+from app.scripts.executors import shutdown_pools
+from app.scripts.jobs import training_queue
+from app.scripts.metrics import RequestMetrics
+from app.scripts.version_registry import version_registry
+from app.scripts.warmup import readiness, warmup
 
 app = FastAPI(title="Apple AI", docs_url=settings.app_prefix + "/docs")
-setup_db()
 
 # Make directory to dump data
 if not os.path.exists(settings.data_dir):
@@ -18,3 +26,63 @@ if not os.path.exists(settings.data_dir):
 
 app.include_router(model_route)
 app.include_router(status_router)
+app.add_middleware(
+    AdmissionControl,
+    limiters=admission_limiters,
+    retry_after=settings.admission_retry_after_seconds,
+)
+app.add_middleware(
+    RequestMetrics,
+    endpoints={
+        "/train": Endpoint.TRAIN,
+        "/evaluate": Endpoint.EVALUATE,
+        "/predict": Endpoint.PREDICT,
+        "/predict/batch": Endpoint.PREDICT_BATCH,
+    },
+    timing_header=settings.debug_timing_header,
+)
+
+
+@app.on_event("startup")
+def setup_database() -> None:
+    """Create the database and its tables unless they are managed elsewhere."""
+    if settings.setup_database:
+        setup_db()
+    readiness.complete(StartupStep.DATABASE)
+
+
+@app.on_event("startup")
+def load_model_versions() -> None:
+    """Load the model version metadata into the version registry."""
+    with Session(engine) as db:
+        version_registry.load(db)
+    readiness.complete(StartupStep.MODEL_VERSIONS)
+
+
+@app.on_event("startup")
+def start_warmup() -> None:
+    """Import TensorFlow and preload models without delaying startup."""
+    warmup.start()
+
+
+@app.on_event("startup")
+def start_training_queue() -> None:
+    """Fail jobs orphaned by stopped workers and start consuming queued jobs."""
+    training_queue.recover()
+    training_queue.start()
+
+
+@app.on_event("startup")
+def start_audit_writer() -> None:
+    """Start flushing buffered prediction history."""
+    audit_writer.start()
+
+
+@app.on_event("shutdown")
+async def stop_workers() -> None:
+    """Stop the training queue, flush the audit writer and release resources."""
+    await warmup.stop()
+    await training_queue.stop()
+    await audit_writer.stop()
+    shutdown_pools()
+    await async_engine.dispose()
@@ -1,48 +1,57 @@
 """File contains model training and test related APIs."""
 
+import hashlib
 import json
-from os import path
-from uuid import uuid4
+import shutil
+import zipfile
+from os import makedirs, path
+from typing import IO, AsyncIterator, Dict, Optional, Tuple, Union
+from uuid import UUID, uuid4
 
 import aiofiles
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from PIL import Image
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
 
 from app.config import settings
-from app.constants import APIConstants, Operations, ResponseMessage
-from app.datamodel import crud, models
-from app.dependencies import get_db
-from app.scripts.db_scripts import get_model_class_map, get_model_id
-from app.scripts.learning import (
-    create_model,
-    evaluate_model,
-    load_model,
-    make_prediction,
-    save_model,
-    train_model,
+from app.constants import (
+    APIConstants,
+    Endpoint,
+    JobStatus,
+    ModelConstants,
+    Operations,
+    ResponseMessage,
 )
-from app.utils import unzip_data
+from app.datamodel import async_crud, models
+from app.dependencies import get_async_db
+from app.scripts.async_db_scripts import (
+    count_queued_training_jobs,
+    has_pending_training_job,
+)
+from app.scripts.audit import audit_writer
+from app.scripts.batching import get_batcher
+from app.scripts.executors import evaluation_pool, inference_pool
+from app.scripts.jobs import get_job_dir, get_validation_dir, training_queue
+from app.scripts.lazy_modules import learning_module
+from app.scripts.metrics import UPLOAD_BYTES, timed
+from app.scripts.model_registry import model_registry
+from app.scripts.prediction_cache import prediction_cache
+from app.scripts.version_registry import version_registry
+from app.utils import ZipLimitError, chunked, iter_image_files, unzip_data, validate_zip
 
 model_route = APIRouter()
 
 
-@model_route.post("/train")
-async def train(
-    model_version: str,
-    file: UploadFile = File(
-        alias="training-file",
-        title="Training image dataset",
-    ),
-    db: Session = Depends(get_db),
-):
-    """Model training api."""
-    model_id = uuid4()
-    target_zip_filepath = path.join(settings.data_dir, path.basename(file.filename))
-
-    # Upload the file
+async def upload_file(file: UploadFile, target_file: str) -> str:
+    """Write an uploaded file to disk in chunks and return its sha256 digest."""
+    digest = hashlib.sha256()
     try:
-        async with aiofiles.open(target_zip_filepath, "wb") as f:
+        async with aiofiles.open(target_file, "wb") as f:
             while chunk := await file.read(APIConstants.UPLOAD_CHUNK_SIZE.value):
+                digest.update(chunk)
                 await f.write(chunk)
 
     except Exception as ex:
@@ -54,31 +63,152 @@ async def train(
     finally:
         await file.close()
 
-    extracted_data_dir = unzip_data(target_zip_filepath)
-
-    # Training
-    model = create_model()
-    model, class_indices = train_model(model, extracted_data_dir)
-    save_model(model, model_id)
-
-    # Save the model and training details in DB
-    model_record = crud.get_or_create(
-        db,
-        models.ImageModel,
-        dict(
-            image_model_uuid=model_id,
-            version=model_version,
-            class_map=json.dumps(class_indices),
-        ),
-        commit=False,
-    )
-    crud.create(
-        db,
-        models.Operation,
-        dict(name=Operations.TRAIN, model_uuid=model_record.image_model_uuid),
-    )
+    return digest.hexdigest()
+
+
+async def read_upload(file: UploadFile, max_bytes: int) -> Tuple[bytes, str]:
+    """Read an uploaded file into memory in chunks, returning it and its sha256."""
+    digest = hashlib.sha256()
+    content = bytearray()
+    try:
+        while chunk := await file.read(APIConstants.UPLOAD_CHUNK_SIZE.value):
+            if len(content) + len(chunk) > max_bytes:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=ResponseMessage.UPLOAD_TOO_LARGE.value.format(
+                        max_bytes=max_bytes
+                    ),
+                )
+            digest.update(chunk)
+            content += chunk
+
+    except HTTPException:
+        raise
+
+    except Exception as ex:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error Uploading file! {ex}",
+        )
+
+    finally:
+        await file.close()
+
+    return bytes(content), digest.hexdigest()
+
+
+async def archive_image(content: bytes, content_hash: str, filename: str) -> str:
+    """Store an image under its content hash, returning the stored path."""
+    _, extension = path.splitext(path.basename(filename))
+    target_dir = path.join(settings.data_dir, "images", content_hash[:2])
+    target_file = path.join(target_dir, content_hash + extension.lower())
+
+    if not path.isfile(target_file):
+        makedirs(target_dir, exist_ok=True)
+        async with aiofiles.open(target_file, "wb") as f:
+            await f.write(content)
+
+    return target_file
+
+
+async def validate_archive(source: Union[str, IO[bytes]]) -> None:
+    """Reject invalid archives and archives exceeding the ingestion limits."""
+    try:
+        await run_in_threadpool(validate_zip, source)
+
+    except ZipLimitError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(ex),
+        )
+
+    except zipfile.BadZipFile as ex:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=ResponseMessage.INVALID_ARCHIVE.value.format(error=ex),
+        )
+
+
+async def receive_archive(file: UploadFile, target_dir: str) -> str:
+    """Upload a training archive into a directory and validate it."""
+    makedirs(target_dir, exist_ok=True)
+    target_zip_filepath = path.join(target_dir, path.basename(file.filename))
+
+    with timed(Endpoint.TRAIN, "upload"):
+        await upload_file(file, target_zip_filepath)
+    UPLOAD_BYTES.labels(Endpoint.TRAIN).observe(path.getsize(target_zip_filepath))
+    with timed(Endpoint.TRAIN, "validate"):
+        await validate_archive(target_zip_filepath)
+
+    return target_zip_filepath
+
+
+@model_route.post("/train", status_code=status.HTTP_202_ACCEPTED)
+async def train(
+    model_version: str,
+    file: UploadFile = File(
+        alias="training-file",
+        title="Training image dataset",
+    ),
+    validation_file: Optional[UploadFile] = File(
+        None,
+        alias="validation-file",
+        title="Held-out image dataset for the export accuracy check",
+    ),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Model training api, queues a training job and returns its id."""
+    # Versions are never replaced, refuse taken ones before the upload
+    with timed(Endpoint.TRAIN, "lookup"):
+        version_taken = await version_registry.get(model_version) is not None
+        if not version_taken:
+            version_taken = await has_pending_training_job(db, model_version)
+    if version_taken:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=ResponseMessage.MODEL_VERSION_EXISTS.value.format(
+                model_version=model_version
+            ),
+        )
+
+    # Refuse before the upload when the backlog is full
+    with timed(Endpoint.TRAIN, "db"):
+        queued = await count_queued_training_jobs(db)
+    if queued >= settings.training_job_max_queued:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=ResponseMessage.TOO_MANY_TRAINING_JOBS.value.format(queued=queued),
+            headers={"Retry-After": str(settings.admission_retry_after_seconds)},
+        )
 
-    return {"message": ResponseMessage.TRAINING_SUCCESS.value}
+    job_id = uuid4()
+    job_dir = get_job_dir(job_id)
+
+    # Upload the files
+    try:
+        target_zip_filepath = await receive_archive(file, job_dir)
+        if validation_file is not None:
+            await receive_archive(validation_file, get_validation_dir(job_id))
+    except HTTPException:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+    # Queue the training job
+    with timed(Endpoint.TRAIN, "db"):
+        await async_crud.create(
+            db,
+            models.TrainingJob,
+            dict(
+                job_uuid=job_id,
+                model_version=model_version,
+                model_uuid=uuid4(),
+                data=target_zip_filepath,
+                status=JobStatus.QUEUED,
+            ),
+        )
+    training_queue.notify()
+
+    return {"message": ResponseMessage.TRAINING_QUEUED.value, "job_id": job_id}
 
 
 @model_route.post("/evaluate")
@@ -88,60 +218,85 @@ async def evaluate(
         alias="evaluation-file",
         title="Evaluation image dataset",
     ),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Evaluate api."""
-    model_query = get_model_id(db, model_version)
+    with timed(Endpoint.EVALUATE, "lookup"):
+        model_version_record = await version_registry.get(model_version)
 
-    if not model_query:
+    if not model_version_record:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=ResponseMessage.MODEL_DOESNT_EXIST.value.format(model_version=model_version),
         )
-    model_id = model_query[0]
+    model_id = model_version_record.image_model_uuid
+    learning = await learning_module.aload()
+
+    if learning.supports_zip_streaming():
+        # Read the images straight out of the spooled upload
+        UPLOAD_BYTES.labels(Endpoint.EVALUATE).observe(file.file.seek(0, 2))
+        file.file.seek(0)
+        with timed(Endpoint.EVALUATE, "validate"):
+            await validate_archive(file.file)
+        eval_data = file.file
+    else:
+        target_zip_filepath = path.join(settings.data_dir, path.basename(file.filename))
+
+        # Upload the file
+        with timed(Endpoint.EVALUATE, "upload"):
+            await upload_file(file, target_zip_filepath)
+        UPLOAD_BYTES.labels(Endpoint.EVALUATE).observe(
+            path.getsize(target_zip_filepath)
+        )
+        with timed(Endpoint.EVALUATE, "validate"):
+            await validate_archive(target_zip_filepath)
 
-    target_zip_filepath = path.join(settings.data_dir, path.basename(file.filename))
+        with timed(Endpoint.EVALUATE, "extract"):
+            eval_data = await run_in_threadpool(unzip_data, target_zip_filepath)
 
-    # Upload the file
+    # Evaluation
     try:
-        async with aiofiles.open(target_zip_filepath, "wb") as f:
-            while chunk := await file.read(APIConstants.UPLOAD_CHUNK_SIZE.value):
-                await f.write(chunk)
-
-    except Exception as ex:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error Uploading file! {ex}",
-        )
-
+        with timed(Endpoint.EVALUATE, "model"):
+            model = await evaluation_pool.run(model_registry.get, model_id)
+        with timed(Endpoint.EVALUATE, "evaluate"):
+            metrics = await evaluation_pool.run(
+                learning.evaluate_model, model, eval_data
+            )
     finally:
         await file.close()
 
-    extracted_data_dir = unzip_data(target_zip_filepath)
-
-    # Evaluation
-    model = load_model(model_id)
-    score = evaluate_model(model, extracted_data_dir)
-
     # Update evaluation statistics
-    operation_record = crud.create(
-        db,
-        models.Operation,
-        dict(name=Operations.EVALUATE, model_uuid=model_id),
-        commit=False,
-    )
-    crud.create(
-        db,
-        models.Evaluate,
-        dict(
-            data=file.filename,
-            output=str(score[1]),
-            metrics=str(score[0]),
-            operation_uuid=operation_record.operation_uuid,
-        ),
-    )
+    with timed(Endpoint.EVALUATE, "db"):
+        operation_record = await async_crud.create(
+            db,
+            models.Operation,
+            dict(name=Operations.EVALUATE, model_uuid=model_id),
+            commit=False,
+        )
+        await async_crud.create(
+            db,
+            models.Evaluate,
+            dict(
+                data=file.filename,
+                output=str(metrics["accuracy"]),
+                accuracy=metrics["accuracy"],
+                loss=metrics["loss"],
+                metrics={
+                    key: value
+                    for key, value in metrics.items()
+                    if key not in ("accuracy", "loss")
+                },
+                operation_uuid=operation_record.operation_uuid,
+            ),
+        )
 
-    return {"Accuracy": score[1], "Loss": score[0]}
+    return {
+        "Accuracy": metrics["accuracy"],
+        "Loss": metrics["loss"],
+        "ConfusionMatrix": metrics["confusion_matrix"],
+        "Precision": metrics["precision"],
+        "Recall": metrics["recall"],
+    }
 
 
 @model_route.post("/predict")
@@ -151,57 +306,135 @@ async def predict(
         alias="test-file",
         title="Prediction image",
     ),
-    db: Session = Depends(get_db),
 ):
     """Predict api."""
-    model_query = get_model_id(db, model_version)
-    if not model_query:
+    with timed(Endpoint.PREDICT, "lookup"):
+        model_version_record = await version_registry.get(model_version)
+    if not model_version_record:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=ResponseMessage.MODEL_DOESNT_EXIST.value.format(
                 model_version=model_version
             ),
         )
-    model_id = model_query[0]
-    target_file = path.join(settings.data_dir, path.basename(file.filename))
+    model_id = model_version_record.image_model_uuid
 
     # Upload file
-    try:
-        async with aiofiles.open(target_file, "wb") as f:
-            while chunk := await file.read(APIConstants.UPLOAD_CHUNK_SIZE.value):
-                await f.write(chunk)
-
-    except Exception as ex:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error Uploading file! {ex}",
+    with timed(Endpoint.PREDICT, "upload"):
+        image_bytes, image_hash = await read_upload(
+            file, settings.max_predict_upload_bytes
         )
-
-    finally:
-        await file.close()
+    UPLOAD_BYTES.labels(Endpoint.PREDICT).observe(len(image_bytes))
 
     # Prediction
-    class_indices = get_model_class_map(db, model_id)
-    model = load_model(model_id)
-    target = make_prediction(model, target_file)
-    idx = target[0].argmax()
-    predict_dict = {v: k for k, v in json.loads(class_indices).items()}
+    with timed(Endpoint.PREDICT, "cache"):
+        prediction = await prediction_cache.get(model_id, image_hash)
+    if prediction is None:
+        learning = await learning_module.aload()
+        try:
+            with timed(Endpoint.PREDICT, "preprocess"):
+                img = await inference_pool.run(learning.preprocess_bytes, image_bytes)
+        except (OSError, Image.DecompressionBombError):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=ResponseMessage.UNREADABLE_IMAGE.value,
+            )
+        # Reports the batch wait, model load and forward pass stages
+        target = await get_batcher(model_id).predict(model_id, img)
+        prediction = str(model_version_record.classes[target.argmax()])
+        await prediction_cache.put(model_id, image_hash, prediction)
+
+    image_data = file.filename
+    if settings.archive_predict_images:
+        with timed(Endpoint.PREDICT, "archive"):
+            image_data = await archive_image(image_bytes, image_hash, file.filename)
 
     # Save the prediction result in DB
-    operation_record = crud.create(
-        db,
-        models.Operation,
-        dict(name=Operations.PREDICT, model_uuid=model_id),
-        commit=False,
+    with timed(Endpoint.PREDICT, "audit"):
+        await audit_writer.record(model_id, [(image_data, prediction)])
+
+    return {"Prediction": prediction}
+
+
+async def stream_batch_predictions(
+    model_id: UUID, class_map: Dict, data_dir: str, archive_name: str
+) -> AsyncIterator[str]:
+    """Predict extracted images batch by batch and yield NDJSON lines."""
+    learning = await learning_module.aload()
+    with timed(Endpoint.PREDICT_BATCH, "model"):
+        model = await inference_pool.run(model_registry.get, model_id)
+    img_batches = chunked(
+        iter_image_files(data_dir), ModelConstants.PREDICT_BATCH_SIZE.value
     )
-    crud.create(
-        db,
-        models.Predict,
-        dict(
-            data=target_file,
-            output=str(predict_dict[idx]),
-            operation_uuid=operation_record.operation_uuid,
+
+    for img_paths in img_batches:
+        valid_paths, outputs = await inference_pool.run(
+            learning.make_batch_prediction, model, img_paths
+        )
+
+        predictions = [
+            (
+                path.join(archive_name, path.relpath(img_path, data_dir)),
+                str(class_map[output.argmax()]),
+            )
+            for img_path, output in zip(valid_paths, outputs)
+        ]
+        with timed(Endpoint.PREDICT_BATCH, "audit"):
+            await audit_writer.record(model_id, predictions)
+
+        for data, output in predictions:
+            yield json.dumps({"data": data, "Prediction": output}) + "\n"
+
+        for img_path in set(img_paths) - set(valid_paths):
+            data = path.join(archive_name, path.relpath(img_path, data_dir))
+            yield json.dumps(
+                {"data": data, "error": ResponseMessage.UNREADABLE_IMAGE.value}
+            ) + "\n"
+
+
+@model_route.post("/predict/batch")
+async def predict_batch(
+    model_version: str,
+    file: UploadFile = File(
+        alias="test-file",
+        title="Zip archive of prediction images",
+    ),
+):
+    """Batch predict api, streams one NDJSON line per image in the archive."""
+    with timed(Endpoint.PREDICT_BATCH, "lookup"):
+        model_version_record = await version_registry.get(model_version)
+    if not model_version_record:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=ResponseMessage.MODEL_DOESNT_EXIST.value.format(
+                model_version=model_version
+            ),
+        )
+    model_id = model_version_record.image_model_uuid
+
+    # Upload and extract the archive in its own directory
+    batch_dir = path.join(settings.data_dir, "batches", str(uuid4()))
+    makedirs(batch_dir)
+    target_zip_filepath = path.join(batch_dir, path.basename(file.filename))
+    try:
+        with timed(Endpoint.PREDICT_BATCH, "upload"):
+            await upload_file(file, target_zip_filepath)
+        UPLOAD_BYTES.labels(Endpoint.PREDICT_BATCH).observe(
+            path.getsize(target_zip_filepath)
+        )
+        with timed(Endpoint.PREDICT_BATCH, "validate"):
+            await validate_archive(target_zip_filepath)
+        with timed(Endpoint.PREDICT_BATCH, "extract"):
+            await run_in_threadpool(unzip_data, target_zip_filepath)
+    except Exception:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        raise
+
+    # Removed once the response ends, also when the client disconnects early
+    return StreamingResponse(
+        stream_batch_predictions(
+            model_id, model_version_record.classes, batch_dir, file.filename
         ),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(shutil.rmtree, batch_dir, ignore_errors=True),
     )
-
-    return {"Prediction": str(predict_dict[idx])}
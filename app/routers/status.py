@@ -1,28 +1,178 @@
 """File contains status related APIs."""
 
-from typing import List
+import base64
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from uuid import UUID
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.dependencies import get_db
-from app.schema import HistoryResponse, MetadataResponse
-from app.scripts.db_scripts import get_history_records, get_model_details
+from app.constants import APIConstants, Operations, ResponseMessage
+from app.datamodel.database import AsyncSessionLocal
+from app.dependencies import get_async_db, get_db
+from app.schema import HistoryResponse, MetadataResponse, TrainingJobResponse
+from app.scripts.admission import admission_stats
+from app.scripts.async_db_scripts import get_history_records, history_query
+from app.scripts.audit import audit_writer
+from app.scripts.batching import batcher_stats
+from app.scripts.db_scripts import get_training_job, get_training_jobs
+from app.scripts.executors import pool_stats
+from app.scripts.jobs import training_queue
+from app.scripts.metrics import register_stats
+from app.scripts.model_registry import model_registry
+from app.scripts.prediction_cache import prediction_cache
+from app.scripts.version_registry import version_registry
+from app.scripts.warmup import readiness
 
 status_router = APIRouter()
 
+register_stats("model_cache", model_registry.stats)
+register_stats("model_versions", version_registry.stats)
+register_stats("prediction_cache", prediction_cache.stats)
+register_stats("audit", audit_writer.stats)
+register_stats("training_jobs", training_queue.stats)
+register_stats("batcher", batcher_stats, label="batcher")
+register_stats("executor", pool_stats, label="pool")
+register_stats("admission", admission_stats, label="endpoint")
+
 
 @status_router.get("/metadata", response_model=List[MetadataResponse])
-def get_metadata(
-    db: Session = Depends(get_db),
-):
+async def get_metadata():
     """Get details of all the model versions present."""
-    return get_model_details(db)
+    return await version_registry.all()
+
+
+def encode_cursor(row: Any) -> str:
+    """Opaque cursor pointing after a history row."""
+    position = f"{row.time.isoformat()},{row.operation_uuid}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        time, operation_uuid = base64.urlsafe_b64decode(cursor).decode().split(",")
+        return datetime.fromisoformat(time), UUID(operation_uuid)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=ResponseMessage.INVALID_CURSOR.value,
+        )
+
+
+async def stream_history(filters: Dict[str, Any]) -> AsyncIterator[str]:
+    """Yield history rows as NDJSON lines from a server side cursor."""
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            history_query(**filters).execution_options(
+                yield_per=APIConstants.HISTORY_STREAM_CHUNK_SIZE.value
+            )
+        )
+        async for row in result:
+            yield HistoryResponse.from_orm(row).json() + "\n"
 
 
 @status_router.get("/history", response_model=List[HistoryResponse])
-def get_history(
+async def get_history(
+    response: Response,
+    model_version: Optional[str] = None,
+    operation: Optional[str] = Query(
+        None, regex=f"^({Operations.EVALUATE}|{Operations.PREDICT})$"
+    ),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(
+        APIConstants.HISTORY_PAGE_SIZE.value,
+        ge=1,
+        le=APIConstants.HISTORY_MAX_PAGE_SIZE.value,
+    ),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get details of the evaluations and predictions, newest first.
+
+    Results are paginated, the ``X-Next-Cursor`` response header holds the
+    cursor of the next page. With ``stream`` every matching row is streamed
+    as NDJSON instead.
+    """
+    filters: Dict[str, Any] = dict(operation=operation, start=start, end=end)
+    if model_version is not None:
+        model_version_record = await version_registry.get(model_version)
+        if not model_version_record:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=ResponseMessage.MODEL_DOESNT_EXIST.value.format(
+                    model_version=model_version
+                ),
+            )
+        filters["model_uuid"] = model_version_record.image_model_uuid
+    if cursor is not None:
+        filters["after"] = decode_cursor(cursor)
+
+    if stream:
+        return StreamingResponse(
+            stream_history(filters), media_type="application/x-ndjson"
+        )
+
+    records = await get_history_records(db, limit=limit, **filters)
+    if len(records) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(records[-1])
+
+    return records
+
+
+@status_router.get("/jobs", response_model=List[TrainingJobResponse])
+def get_jobs(
+    limit: int = 20,
+    db: Session = Depends(get_db),
+):
+    """Get the most recent training jobs."""
+    return get_training_jobs(db, limit)
+
+
+@status_router.get("/jobs/{job_id}", response_model=TrainingJobResponse)
+def get_job(
+    job_id: UUID,
     db: Session = Depends(get_db),
 ):
-    """Get details of all the evaluation and prediction."""
-    return get_history_records(db)
+    """Get status and progress of a training job."""
+    job = get_training_job(db, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=ResponseMessage.JOB_DOESNT_EXIST.value.format(job_id=job_id),
+        )
+    return job
+
+
+@status_router.get("/metrics")
+def get_metrics():
+    """Prometheus metrics of this worker process."""
+    return Response(generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+@status_router.get("/ready")
+def get_ready(response: Response):
+    """Readiness probe, 503 until startup and the model warmup completed."""
+    if not readiness.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return readiness.stats()
+
+
+@status_router.get("/stats")
+def get_stats():
+    """Get runtime statistics of the serving components."""
+    return {
+        "model_versions": version_registry.stats(),
+        "model_cache": model_registry.stats(),
+        "prediction_cache": prediction_cache.stats(),
+        "predict_batching": batcher_stats(),
+        "executors": pool_stats(),
+        "training_jobs": training_queue.stats(),
+        "audit": audit_writer.stats(),
+        "admission": admission_stats(),
+    }
@@ -5,6 +5,7 @@ from app.schema.schema import (
     MetadataResponse,
     Operation,
     Predict,
+    TrainingJobResponse,
 )
 
 __all__ = [
@@ -14,4 +15,5 @@ __all__ = [
     "Operation",
     "Predict",
     "HistoryResponse",
+    "TrainingJobResponse",
 ]
@@ -1,7 +1,7 @@
 """Database model and response schemas."""
 
 from datetime import datetime
-from typing import Any
+from typing import Any, Dict, Optional
 from uuid import UUID
 
 from pydantic import BaseModel
@@ -21,7 +21,7 @@ class ImageModel(SchemaBase):
 
     version: str
     created_at: datetime
-    class_map: str
+    class_map: Dict[str, int]
 
     class Config:
         orm_mode = True
@@ -55,7 +55,9 @@ class Evaluate(SchemaBase):
 
     data: str
     output: str
-    metrics: str
+    accuracy: Optional[float]
+    loss: Optional[float]
+    metrics: Optional[Dict[str, Any]]
 
     operation_uuid: UUID
 
@@ -76,3 +78,18 @@ class HistoryResponse(SchemaBase):
     model_uuid: UUID
     data: str
     output: Any
+
+
+class TrainingJobResponse(SchemaBase):
+    """Response schema for training jobs."""
+
+    job_uuid: UUID
+    model_version: str
+    model_uuid: UUID
+    status: str
+    epoch: Optional[int]
+    step: Optional[int]
+    loss: Optional[float]
+    error: Optional[str]
+    created_at: datetime
+    updated_at: Optional[datetime]
@@ -0,0 +1,156 @@
+"""Admission control of the modelling endpoints."""
+
+import asyncio
+from typing import Any, Callable, Dict
+
+from fastapi import status
+from starlette.responses import JSONResponse
+
+from app.config import settings
+from app.constants import ResponseMessage
+
+
+class AdmissionRejected(Exception):
+    """Request refused because its endpoint is saturated."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class AdmissionLimiter:
+    """Concurrency limit of an endpoint with a bounded wait queue.
+
+    At most ``max_concurrency`` requests run at once and at most
+    ``max_queued`` more wait for a slot. Requests arriving to a full queue are
+    rejected with 429, and requests waiting longer than ``queue_timeout``
+    seconds with 503.
+    """
+
+    def __init__(
+        self, name: str, max_concurrency: int, max_queued: int, queue_timeout: float
+    ):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout = queue_timeout
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.queued = 0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def acquire(self) -> None:
+        """Wait for a free slot, raising AdmissionRejected when saturated."""
+        if self.running + self.queued >= self.max_concurrency + self.max_queued:
+            self.rejected += 1
+            raise AdmissionRejected(
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                ResponseMessage.TOO_MANY_REQUESTS.value.format(endpoint=self.name),
+            )
+
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise AdmissionRejected(
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                ResponseMessage.OVERLOADED.value.format(endpoint=self.name),
+            )
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        self.admitted += 1
+
+    def release(self) -> None:
+        self.running -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queued": self.max_queued,
+            "running": self.running,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class AdmissionControl:
+    """ASGI middleware admitting requests through the limiter of their path.
+
+    Requests are admitted before their body is read, so rejected uploads
+    never reach the disk. The slot is held until the response, including
+    streamed ones, is fully sent.
+    """
+
+    def __init__(
+        self, app: Callable, limiters: Dict[str, AdmissionLimiter], retry_after: int
+    ):
+        self.app = app
+        self.limiters = limiters
+        self.retry_after = retry_after
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        limiter = self.limiters.get(scope["path"]) if scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except AdmissionRejected as ex:
+            response = JSONResponse(
+                {"detail": ex.detail},
+                status_code=ex.status_code,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+def create_limiter(
+    name: str, max_concurrency: int, max_queued: int
+) -> AdmissionLimiter:
+    return AdmissionLimiter(
+        name,
+        max_concurrency=max_concurrency,
+        max_queued=max_queued,
+        queue_timeout=settings.admission_queue_timeout_seconds,
+    )
+
+
+# Separate budgets, so heavy endpoints can't starve the cheap ones
+admission_limiters = {
+    "/predict": create_limiter(
+        "predict", settings.predict_max_concurrency, settings.predict_max_queued
+    ),
+    "/predict/batch": create_limiter(
+        "batch predict",
+        settings.predict_batch_max_concurrency,
+        settings.predict_batch_max_queued,
+    ),
+    "/evaluate": create_limiter(
+        "evaluate", settings.evaluate_max_concurrency, settings.evaluate_max_queued
+    ),
+    "/train": create_limiter(
+        "train", settings.train_max_concurrency, settings.train_max_queued
+    ),
+}
+
+
+def admission_stats() -> Dict[str, Any]:
+    return {limiter.name: limiter.stats() for limiter in admission_limiters.values()}
@@ -0,0 +1,111 @@
+"""Database operation functions for async sessions."""
+from datetime import datetime
+from typing import Any, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import func, literal, select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from app.constants import JobStatus
+from app.datamodel.models import Evaluate, ImageModel, Operation, Predict, TrainingJob
+
+
+async def get_model_id(db: AsyncSession, model_version: str):
+    """Get image model id."""
+    result = await db.execute(
+        select(ImageModel.image_model_uuid).filter_by(version=model_version)
+    )
+    return result.one_or_none()
+
+
+async def get_model_class_map(db: AsyncSession, model_uuid: UUID):
+    """Get target to index map for a model."""
+    result = await db.execute(
+        select(ImageModel.class_map).filter_by(image_model_uuid=model_uuid)
+    )
+    return result.scalar_one()
+
+
+async def count_queued_training_jobs(db: AsyncSession) -> int:
+    """Count the training jobs waiting for a worker."""
+    result = await db.execute(
+        select(func.count()).select_from(TrainingJob).filter_by(status=JobStatus.QUEUED)
+    )
+    return result.scalar_one()
+
+
+async def has_pending_training_job(db: AsyncSession, model_version: str) -> bool:
+    """Check whether a queued or running training job produces a model version."""
+    result = await db.execute(
+        select(TrainingJob.job_uuid)
+        .filter_by(model_version=model_version)
+        .filter(TrainingJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]))
+        .limit(1)
+    )
+    return result.first() is not None
+
+
+def history_query(
+    model_uuid: Optional[UUID] = None,
+    operation: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, UUID]] = None,
+) -> Select:
+    """Query evaluations and predictions, newest first.
+
+    ``after`` is the (time, operation uuid) of the last row of the previous
+    page, rows are ordered by that pair so pages are stable under inserts.
+    """
+    evaluate_data = select(
+        Operation.operation_uuid,
+        Operation.name,
+        Operation.time,
+        Operation.model_uuid,
+        Evaluate.data,
+        Evaluate.output,
+    ).join(Evaluate)
+    predict_data = select(
+        Operation.operation_uuid,
+        Operation.name,
+        Operation.time,
+        Operation.model_uuid,
+        Predict.data,
+        Predict.output,
+    ).join(Predict)
+
+    history = union_all(evaluate_data, predict_data).subquery()
+    query = select(history)
+
+    if model_uuid is not None:
+        query = query.where(history.c.model_uuid == model_uuid)
+    if operation is not None:
+        query = query.where(history.c.name == operation)
+    if start is not None:
+        query = query.where(history.c.time >= start)
+    if end is not None:
+        query = query.where(history.c.time < end)
+    if after is not None:
+        time, operation_uuid = after
+        query = query.where(
+            tuple_(history.c.time, history.c.operation_uuid)
+            < tuple_(
+                literal(time, history.c.time.type),
+                literal(operation_uuid, history.c.operation_uuid.type),
+            )
+        )
+
+    return query.order_by(history.c.time.desc(), history.c.operation_uuid.desc())
+
+
+async def get_history_records(
+    db: AsyncSession, limit: Optional[int] = None, **filters: Any
+):
+    """Get details of prediction and evaluation."""
+    query = history_query(**filters)
+    if limit is not None:
+        query = query.limit(limit)
+
+    result = await db.execute(query)
+    return result.all()
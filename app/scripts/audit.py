@@ -0,0 +1,266 @@
+"""Buffered writer of prediction history."""
+
+import asyncio
+import json
+import time
+from datetime import datetime
+from logging import getLogger
+from os import makedirs, path
+from threading import Lock
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from uuid import UUID, uuid4
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.constants import Operations
+from app.datamodel import crud, models
+from app.datamodel.database import engine
+
+logger = getLogger(__name__)
+
+
+class AuditRecord(NamedTuple):
+    """Operation and Predict rows of one prediction."""
+
+    operation: Dict[str, Any]
+    predict: Dict[str, Any]
+    attempts: int = 0
+
+
+class AuditWriter:
+    """Buffer Operation and Predict records and insert them in batches.
+
+    Buffered records are flushed when ``max_batch_size`` of them are queued or
+    ``flush_interval`` seconds after the previous flush, and once more when the
+    writer is stopped. At most ``max_buffered`` records are kept, the oldest
+    are dropped beyond that. A batch rejected for its data is split until the
+    offending records are isolated, those and records that failed to write
+    ``max_attempts`` times are appended to the ``dead_letter_path`` file. In
+    synchronous mode, or before the writer is started, every call is written
+    before it returns and raises when the write fails.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int,
+        flush_interval: float,
+        max_buffered: int,
+        max_attempts: int,
+        dead_letter_path: str,
+        synchronous: bool = False,
+    ):
+        self.max_batch_size = max(1, max_batch_size)
+        self.flush_interval = flush_interval
+        self.max_buffered = max(self.max_batch_size, max_buffered)
+        self.max_attempts = max(1, max_attempts)
+        self.dead_letter_path = dead_letter_path
+        self.synchronous = synchronous
+
+        self._records: List[AuditRecord] = []
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.written = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._records)
+
+    def create_records(
+        self, model_id: UUID, predictions: List[Tuple[str, str]]
+    ) -> List[AuditRecord]:
+        """Create the records of predict operations for (data, output) pairs."""
+        now = datetime.utcnow()
+        records = []
+        for data, output in predictions:
+            operation_uuid = uuid4()
+            records.append(
+                AuditRecord(
+                    operation=dict(
+                        operation_uuid=operation_uuid,
+                        name=Operations.PREDICT,
+                        time=now,
+                        model_uuid=model_id,
+                    ),
+                    predict=dict(
+                        predict_uuid=uuid4(),
+                        data=data,
+                        output=output,
+                        operation_uuid=operation_uuid,
+                    ),
+                )
+            )
+
+        return records
+
+    def add(self, model_id: UUID, predictions: List[Tuple[str, str]]) -> None:
+        """Buffer predict operations for a list of (data, output) pairs."""
+        self._buffer(self.create_records(model_id, predictions))
+
+    def _buffer(self, records: List[AuditRecord], retry: bool = False) -> None:
+        with self._lock:
+            if retry:
+                self._records[:0] = records
+            else:
+                self._records.extend(records)
+
+            overflow = len(self._records) - self.max_buffered
+            if overflow > 0:
+                del self._records[:overflow]
+                self.dropped += overflow
+
+        if overflow > 0:
+            logger.error("Audit buffer full, dropped %d oldest predictions.", overflow)
+
+    async def record(self, model_id: UUID, predictions: List[Tuple[str, str]]) -> None:
+        """Queue predict operations, writing them at once in synchronous mode."""
+        if self.synchronous or self._task is None:
+            records = self.create_records(model_id, predictions)
+            await run_in_threadpool(self._write_now, records)
+            return
+
+        self.add(model_id, predictions)
+        if self.queue_depth >= self.max_batch_size:
+            self._wakeup.set()
+
+    def _write_now(self, records: List[AuditRecord]) -> None:
+        with self._flush_lock:
+            self._insert(records)
+            self.written += len(records)
+
+    def _insert(self, records: List[AuditRecord]) -> None:
+        with Session(engine) as db:
+            crud.bulk_create(
+                db,
+                models.Operation,
+                [record.operation for record in records],
+                commit=False,
+            )
+            crud.bulk_create(db, models.Predict, [record.predict for record in records])
+
+    def _write(self, records: List[AuditRecord]) -> List[AuditRecord]:
+        """Insert records, returning those that failed for a transient error."""
+        try:
+            self._insert(records)
+        except (DataError, IntegrityError) as ex:
+            if len(records) == 1:
+                logger.error("Rejected prediction record: %s", ex)
+                self._dead_letter(records, str(ex))
+                return []
+
+            middle = len(records) // 2
+            return self._write(records[:middle]) + self._write(records[middle:])
+        except Exception:
+            logger.exception("Failed to write %d predictions.", len(records))
+            return records
+
+        self.written += len(records)
+        return []
+
+    def flush(self) -> None:
+        """Write every buffered record, retrying failed ones in the next flush."""
+        with self._flush_lock:
+            with self._lock:
+                records, self._records = self._records, []
+            if not records:
+                return
+
+            start = time.perf_counter()
+            failed = self._write(records)
+            if failed:
+                self.failures += 1
+                retry = [
+                    record._replace(attempts=record.attempts + 1) for record in failed
+                ]
+                self._dead_letter(
+                    [
+                        record
+                        for record in retry
+                        if record.attempts >= self.max_attempts
+                    ],
+                    "Too many failed attempts.",
+                )
+                self._buffer(
+                    [record for record in retry if record.attempts < self.max_attempts],
+                    retry=True,
+                )
+                return
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+
+    def _dead_letter(self, records: List[AuditRecord], error: str) -> None:
+        if not records:
+            return
+
+        self.dead_lettered += len(records)
+        try:
+            makedirs(path.dirname(self.dead_letter_path), exist_ok=True)
+            with open(self.dead_letter_path, "a") as f:
+                for record in records:
+                    line = dict(
+                        operation=record.operation, predict=record.predict, error=error
+                    )
+                    f.write(json.dumps(line, default=str) + "\n")
+        except OSError:
+            logger.exception("Failed to dead-letter %d predictions.", len(records))
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background flushes and write what is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await run_in_threadpool(self.flush)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await run_in_threadpool(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_buffered": self.max_buffered,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "dead_lettered": self.dead_lettered,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "mean_flush_ms": self.total_flush_ms / self.flushes if self.flushes else 0,
+        }
+
+
+audit_writer = AuditWriter(
+    max_batch_size=settings.audit_batch_size,
+    flush_interval=settings.audit_flush_seconds,
+    max_buffered=settings.audit_max_buffered,
+    max_attempts=settings.audit_max_attempts,
+    dead_letter_path=path.join(settings.data_dir, "audit", "dead_letter.jsonl"),
+    synchronous=settings.audit_synchronous,
+)
@@ -0,0 +1,235 @@
+"""Dynamic micro-batching of prediction requests."""
+
+import asyncio
+import time
+from logging import getLogger
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.config import settings
+from app.constants import Endpoint
+from app.scripts.executors import inference_pool
+from app.scripts.lazy_modules import shared_backbone_module
+from app.scripts.metrics import BATCH_SIZE, record_stage, request_timings
+from app.scripts.model_registry import model_registry
+
+logger = getLogger(__name__)
+
+
+class BatchItem(NamedTuple):
+    """A queued prediction request."""
+
+    model_id: UUID
+    img: np.ndarray
+    future: asyncio.Future
+    queued_at: float
+
+
+class BatchTimings(NamedTuple):
+    """Stages of a batched forward pass, reported by each of its requests."""
+
+    wait: float
+    model: float
+    forward: float
+
+
+class PredictionBatcher:
+    """Coalesce concurrent predictions for a model into batched forward passes.
+
+    Requests are collected until either ``max_batch_size`` images are queued or
+    ``max_wait_ms`` has elapsed since the first one arrived, then a single
+    ``predict`` call is made and the rows are handed back to the callers. The
+    worker exits after ``idle_seconds`` without requests and calls ``on_idle``.
+
+    Each request reports the time it waited for its batch to start, the model
+    load and the forward pass of its batch as its own stages.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_batch_size: int,
+        max_wait_ms: float,
+        idle_seconds: float,
+        on_idle: Optional[Callable[["PredictionBatcher"], None]] = None,
+    ):
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.idle_seconds = idle_seconds
+        self.on_idle = on_idle
+
+        self._queue: "asyncio.Queue[BatchItem]" = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.items = 0
+
+    async def predict(self, model_id: UUID, img: np.ndarray) -> np.ndarray:
+        """Queue a preprocessed image batch of one and wait for its output row."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(BatchItem(model_id, img, future, time.perf_counter()))
+
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+        output, timings = await future
+        record_stage(Endpoint.PREDICT, "batch_wait", timings.wait)
+        record_stage(Endpoint.PREDICT, "model", timings.model)
+        record_stage(Endpoint.PREDICT, "forward", timings.forward)
+        return output
+
+    async def _collect(self) -> Optional[List[BatchItem]]:
+        loop = asyncio.get_running_loop()
+        try:
+            batch = [await asyncio.wait_for(self._queue.get(), self.idle_seconds)]
+        except asyncio.TimeoutError:
+            return None
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self) -> None:
+        # The worker serves many requests, not the one that happened to start it
+        request_timings.set(None)
+        while True:
+            batch = await self._collect()
+            if batch is None:
+                if not self._queue.empty():
+                    continue
+                if self.on_idle is not None:
+                    self.on_idle(self)
+                return
+            await self._process(batch)
+
+    async def _process(self, batch: List[BatchItem]) -> None:
+        model_ids = [item.model_id for item in batch]
+        inputs = np.concatenate([item.img for item in batch])
+        self.batches += 1
+        self.items += len(batch)
+        BATCH_SIZE.labels(Endpoint.PREDICT).observe(len(batch))
+
+        try:
+            started, loaded, outputs = await inference_pool.run(
+                self._load_and_predict, model_ids, inputs
+            )
+        except Exception as ex:
+            logger.error("Batched prediction failed for %s", self.name)
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(ex)
+            return
+        finished = time.perf_counter()
+
+        for item, output in zip(batch, outputs):
+            if not item.future.done():
+                timings = BatchTimings(
+                    started - item.queued_at, loaded - started, finished - loaded
+                )
+                item.future.set_result((output, timings))
+
+    def _load_and_predict(
+        self, model_ids: List[UUID], inputs: np.ndarray
+    ) -> Tuple[float, float, Any]:
+        # Timestamps of the start of the batch and the end of the model loads
+        started = time.perf_counter()
+        models = {
+            str(model_id): model_registry.get(model_id) for model_id in set(model_ids)
+        }
+        loaded = time.perf_counter()
+        return started, loaded, self._predict(models, model_ids, inputs)
+
+    def _predict(
+        self, models: Dict[str, Any], model_ids: List[UUID], inputs: np.ndarray
+    ) -> np.ndarray:
+        return models[str(model_ids[0])].predict(inputs, verbose=0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0,
+        }
+
+
+class SharedBackboneBatcher(PredictionBatcher):
+    """Batch predictions of every model version through one backbone pass.
+
+    The backbone runs once over the whole batch, then each version's head runs
+    on the feature rows of its own requests.
+    """
+
+    def _predict(
+        self, models: Dict[str, Any], model_ids: List[UUID], inputs: np.ndarray
+    ) -> List:
+        outputs: List = [None] * len(model_ids)
+        features = None
+
+        rows_by_model: Dict[str, List[int]] = {}
+        for row, model_id in enumerate(model_ids):
+            rows_by_model.setdefault(str(model_id), []).append(row)
+
+        for model_key, rows in rows_by_model.items():
+            model = models[model_key]
+            if hasattr(model, "predict_features"):
+                if features is None:
+                    features = (
+                        shared_backbone_module.load().get_backbone().predict(inputs)
+                    )
+                model_outputs = model.predict_features(features[rows])
+            else:
+                # Versions saved without a separate head run their full model
+                model_outputs = model.predict(inputs[rows], verbose=0)
+
+            for row, output in zip(rows, model_outputs):
+                outputs[row] = output
+
+        return outputs
+
+
+_batchers: Dict[str, PredictionBatcher] = {}
+
+SHARED_BATCHER = "shared"
+
+
+def _drop_batcher(batcher: PredictionBatcher) -> None:
+    # Idle batchers are dropped, so those of retrained versions don't pile up
+    if _batchers.get(batcher.name) is batcher:
+        del _batchers[batcher.name]
+
+
+def get_batcher(model_id: UUID) -> PredictionBatcher:
+    """Get the prediction batcher of a model, creating it on first use.
+
+    With a shared backbone every version goes through a single batcher.
+    """
+    key = SHARED_BATCHER if settings.shared_backbone else str(model_id)
+    if key not in _batchers:
+        batcher_class = (
+            SharedBackboneBatcher if settings.shared_backbone else PredictionBatcher
+        )
+        _batchers[key] = batcher_class(
+            key,
+            max_batch_size=settings.predict_max_batch_size,
+            max_wait_ms=settings.predict_max_wait_ms,
+            idle_seconds=settings.predict_batcher_idle_seconds,
+            on_idle=_drop_batcher,
+        )
+
+    return _batchers[key]
+
+
+def batcher_stats() -> Dict[str, Any]:
+    return {key: batcher.stats() for key, batcher in _batchers.items()}
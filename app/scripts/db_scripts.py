@@ -1,9 +1,14 @@
 """File to store database operation functions"""
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
 from uuid import UUID
 
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
-from app.datamodel.models import Evaluate, ImageModel, Operation, Predict
+from app.constants import JobStatus
+from app.datamodel.models import ImageModel, PredictionCacheEntry, TrainingJob
 
 
 def get_model_id(db: Session, model_version: str):
@@ -18,7 +23,7 @@ def get_model_id(db: Session, model_version: str):
 def get_model_class_map(db: Session, model_uuid: UUID):
     """Get target to index map for a model."""
     return (
-        db.query(ImageModel.class_map).filter_by(image_model_uuid=str(model_uuid)).one()[0]
+        db.query(ImageModel.class_map).filter_by(image_model_uuid=model_uuid).one()[0]
     )
 
 
@@ -29,29 +34,126 @@ def get_model_details(db: Session):
     ).all()
 
 
-def get_history_records(db: Session):
-    """Get details of prediction and evaluation."""
-    evaluate_data = (
+def get_model_versions(db: Session):
+    """Get every model version with its class map, oldest first."""
+    return (
         db.query(
-            Operation.name,
-            Operation.time,
-            Operation.model_uuid,
-            Evaluate.data,
-            Evaluate.output,
+            ImageModel.image_model_uuid,
+            ImageModel.version,
+            ImageModel.created_at,
+            ImageModel.class_map,
         )
-        .join(Evaluate)
+        .order_by(ImageModel.created_at)
         .all()
     )
-    predict_data = (
-        db.query(
-            Operation.name,
-            Operation.time,
-            Operation.model_uuid,
-            Predict.data,
-            Predict.output,
+
+
+def get_model_versions_marker(db: Session):
+    """Get the number of model versions and the time the last one was created."""
+    return db.query(func.count(), func.max(ImageModel.created_at)).one()
+
+
+def get_training_job(db: Session, job_uuid: UUID):
+    """Get a training job."""
+    return db.query(TrainingJob).filter_by(job_uuid=job_uuid).one_or_none()
+
+
+def get_training_jobs(db: Session, limit: int):
+    """Get the most recent training jobs."""
+    return (
+        db.query(TrainingJob).order_by(TrainingJob.created_at.desc()).limit(limit).all()
+    )
+
+
+def claim_training_job(db: Session):
+    """Mark the oldest queued training job as running and return it.
+
+    Rows locked by other workers are skipped so several processes can consume
+    the same queue.
+    """
+    job = (
+        db.query(TrainingJob)
+        .filter_by(status=JobStatus.QUEUED)
+        .order_by(TrainingJob.created_at)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job:
+        job.status = JobStatus.RUNNING
+        db.commit()
+
+    return job
+
+
+def fail_stale_training_jobs(
+    db: Session, stale_before: datetime, error: str
+) -> List[UUID]:
+    """Fail running training jobs whose worker stopped reporting, e.g. crashed."""
+    jobs = (
+        db.query(TrainingJob)
+        .filter(
+            TrainingJob.status == JobStatus.RUNNING,
+            or_(
+                TrainingJob.updated_at.is_(None),
+                TrainingJob.updated_at < stale_before,
+            ),
         )
-        .join(Predict)
+        .with_for_update(skip_locked=True)
         .all()
     )
+    for job in jobs:
+        job.status = JobStatus.FAILED
+        job.error = error
+    db.commit()
+
+    return [job.job_uuid for job in jobs]
+
 
-    return evaluate_data + predict_data
+def update_training_job(db: Session, job_uuid: UUID, **values: Any) -> None:
+    """Update the state of a training job."""
+    db.query(TrainingJob).filter_by(job_uuid=job_uuid).update(values)
+    db.commit()
+
+
+def get_cached_prediction(
+    db: Session, model_uuid: UUID, image_hash: str, ttl_seconds: float
+) -> Optional[str]:
+    """Get a cached prediction that is younger than the ttl."""
+    record = (
+        db.query(PredictionCacheEntry.output)
+        .filter_by(model_uuid=model_uuid, image_hash=image_hash)
+        .filter(
+            PredictionCacheEntry.created_at
+            >= datetime.utcnow() - timedelta(seconds=ttl_seconds)
+        )
+        .one_or_none()
+    )
+    return record[0] if record else None
+
+
+def save_cached_prediction(
+    db: Session, model_uuid: UUID, image_hash: str, output: str
+) -> None:
+    """Insert or refresh a cached prediction.
+
+    A single upsert, so concurrent writers of the same entry don't conflict.
+    """
+    statement = insert(PredictionCacheEntry).values(
+        model_uuid=model_uuid,
+        image_hash=image_hash,
+        output=output,
+        created_at=datetime.utcnow(),
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[
+                PredictionCacheEntry.model_uuid,
+                PredictionCacheEntry.image_hash,
+            ],
+            set_=dict(
+                output=statement.excluded.output,
+                created_at=statement.excluded.created_at,
+            ),
+        )
+    )
+    db.commit()
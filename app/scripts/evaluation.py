@@ -0,0 +1,71 @@
+"""Streaming classification metrics."""
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+EPSILON = 1e-7
+
+
+class StreamingMetrics:
+    """Accumulate loss, accuracy and a confusion matrix batch by batch.
+
+    Memory use is bounded by the number of classes, not the dataset size.
+    """
+
+    def __init__(self, num_classes: int):
+        self.num_classes = num_classes
+        self.confusion_matrix: Optional[np.ndarray] = None
+        self.loss_sum = 0.0
+        self.count = 0
+
+    def update(self, y_true: Any, y_pred: Any) -> None:
+        """Add a batch of one-hot labels and predicted probabilities."""
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
+        if not len(y_true):
+            return
+
+        if self.confusion_matrix is None:
+            size = max(self.num_classes, y_pred.shape[-1])
+            self.confusion_matrix = np.zeros((size, size), dtype=np.int64)
+
+        true_idx = y_true.argmax(axis=-1)
+        pred_idx = y_pred.argmax(axis=-1)
+        np.add.at(self.confusion_matrix, (true_idx, pred_idx), 1)
+
+        # Categorical crossentropy
+        true_prob = y_pred[np.arange(len(true_idx)), true_idx]
+        self.loss_sum -= float(np.log(np.clip(true_prob, EPSILON, 1)).sum())
+        self.count += len(true_idx)
+
+    def result(self, class_indices: Dict[str, int]) -> Dict[str, Any]:
+        """Return overall and per-class metrics keyed by class name."""
+        if self.confusion_matrix is None:
+            return dict(
+                accuracy=0.0, loss=0.0, confusion_matrix=[], precision={}, recall={}
+            )
+
+        matrix = self.confusion_matrix
+        true_positives = np.diag(matrix)
+        predicted = matrix.sum(axis=0)
+        actual = matrix.sum(axis=1)
+        class_names = {idx: name for name, idx in class_indices.items()}
+
+        precision, recall = {}, {}
+        for idx in range(len(matrix)):
+            name = class_names.get(idx, str(idx))
+            precision[name] = (
+                float(true_positives[idx] / predicted[idx]) if predicted[idx] else 0.0
+            )
+            recall[name] = (
+                float(true_positives[idx] / actual[idx]) if actual[idx] else 0.0
+            )
+
+        return dict(
+            accuracy=float(true_positives.sum() / self.count),
+            loss=self.loss_sum / self.count,
+            confusion_matrix=matrix.tolist(),
+            precision=precision,
+            recall=recall,
+        )
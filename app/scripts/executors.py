@@ -0,0 +1,123 @@
+"""Executor pools to run blocking work off the event loop."""
+
+import asyncio
+import contextvars
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from app.config import settings
+
+
+class ExecutorPool:
+    """Executor with a concurrency limit and queue depth counters.
+
+    Calls beyond ``max_workers`` wait on a semaphore instead of inside the
+    executor's own queue, so the number of waiting calls can be reported.
+    """
+
+    def __init__(self, name: str, max_workers: int, use_processes: bool = False):
+        self.name = name
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+
+        self._executor: Optional[Executor] = None
+        self._semaphore = asyncio.Semaphore(max_workers)
+
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                # TensorFlow is not fork safe, start workers from a clean interpreter.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=self.name
+                )
+        return self._executor
+
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking callable in the pool and await its result.
+
+        Thread pools run the callable in a copy of the caller's context, so
+        e.g. the stages it times are reported with the request.
+        """
+        call = partial(func, *args, **kwargs)
+        if not self.use_processes:
+            call = partial(contextvars.copy_context().run, call)
+
+        # Callers are cancelled while waiting, e.g. on a client disconnect
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, call
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+        self.completed += 1
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "processes": self.use_processes,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+inference_pool = ExecutorPool(
+    "inference",
+    max_workers=settings.inference_pool_workers,
+)
+# Evaluations hold a thread for a whole dataset, so they get their own threads
+# instead of taking inference threads from /predict
+evaluation_pool = ExecutorPool(
+    "evaluation",
+    max_workers=settings.evaluate_max_concurrency,
+)
+training_pool = ExecutorPool(
+    "training",
+    max_workers=settings.training_pool_workers,
+    use_processes=settings.training_pool_processes,
+)
+
+
+def shutdown_pools() -> None:
+    inference_pool.shutdown()
+    evaluation_pool.shutdown()
+    training_pool.shutdown()
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {
+        pool.name: pool.stats()
+        for pool in (inference_pool, evaluation_pool, training_pool)
+    }
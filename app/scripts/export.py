@@ -0,0 +1,168 @@
+"""Optimized TFLite export of trained model versions."""
+
+import json
+import os
+from itertools import islice
+from logging import getLogger
+from os import path
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+from app.config import settings
+from app.constants import Quantization
+from app.scripts.learning import (
+    DataSource,
+    TFLiteModel,
+    evaluate_model,
+    get_frozen_path,
+    get_head_path,
+    iter_labelled_images,
+    load_frozen_model,
+    load_model,
+    preprocess_bytes,
+)
+from app.scripts.shared_backbone import load_head_model
+
+logger = getLogger(__name__)
+
+
+def get_tflite_path(model_id: UUID) -> str:
+    """Path of the exported TFLite model, stored next to the SavedModel."""
+    return path.join(settings.data_dir, f"{model_id}.tflite")
+
+
+def get_report_path(model_id: UUID) -> str:
+    """Path of the accuracy report of an exported TFLite model."""
+    return path.join(settings.data_dir, f"{model_id}.tflite.json")
+
+
+def calibration_images(train_data: DataSource, size: int) -> List[np.ndarray]:
+    """Preprocessed random sample of the training set for int8 calibration."""
+    images = []
+    for image_bytes, _ in islice(iter_labelled_images(train_data, shuffle=True), size):
+        try:
+            images.append(preprocess_bytes(image_bytes))
+        except (OSError, Image.DecompressionBombError):
+            continue
+
+    return images
+
+
+def convert_model(
+    model: Any, quantization: str, calibration: Optional[List[np.ndarray]] = None
+) -> bytes:
+    """Convert a keras model to a TFLite flatbuffer."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == Quantization.FLOAT16:
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == Quantization.INT8:
+        if not calibration:
+            raise ValueError("int8 quantization needs calibration images.")
+
+        def representative_dataset() -> Iterator[List[np.ndarray]]:
+            for img in calibration:
+                yield [img]
+
+        # Inputs and outputs stay float32 so callers need no changes
+        converter.representative_dataset = representative_dataset
+    else:
+        raise ValueError(f"Unknown quantization: {quantization}")
+
+    return converter.convert()
+
+
+def export_model(
+    model_id: UUID, train_data: DataSource, validation_data: Optional[DataSource] = None
+) -> Dict:
+    """Export a saved model version to TFLite and check its accuracy.
+
+    The quantized model is evaluated against the original on held-out
+    validation data, and the outcome is recorded in a report next to the
+    artifact. Without validation data the export is kept but never served.
+    Kept as a module level function so it can be dispatched to a worker process.
+    """
+    quantization = settings.quantization
+    model = load_model(model_id)
+
+    calibration = None
+    if quantization == Quantization.INT8:
+        calibration = calibration_images(
+            train_data, settings.quantization_calibration_size
+        )
+
+    tflite_path = get_tflite_path(model_id)
+    tmp_path = f"{tflite_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(convert_model(model, quantization, calibration))
+    os.replace(tmp_path, tflite_path)
+
+    accuracy = quantized_accuracy = accuracy_delta = None
+    if validation_data is not None:
+        accuracy = evaluate_model(model, validation_data)["accuracy"]
+        quantized_model = TFLiteModel(tflite_path, settings.warmup_batch_sizes)
+        quantized_accuracy = evaluate_model(quantized_model, validation_data)[
+            "accuracy"
+        ]
+        accuracy_delta = accuracy - quantized_accuracy
+    else:
+        logger.warning("No validation data to check the export of model %s.", model_id)
+
+    report = dict(
+        quantization=quantization,
+        accuracy=accuracy,
+        quantized_accuracy=quantized_accuracy,
+        accuracy_delta=accuracy_delta,
+        saved_model_bytes=sum(
+            path.getsize(path.join(root, name))
+            for root, _, names in os.walk(path.join(settings.data_dir, str(model_id)))
+            for name in names
+        ),
+        tflite_bytes=path.getsize(tflite_path),
+        serve=(
+            accuracy_delta is not None
+            and accuracy_delta <= settings.quantization_max_accuracy_drop
+        ),
+    )
+    with open(get_report_path(model_id), "w") as f:
+        json.dump(report, f)
+
+    logger.info("Exported model %s to TFLite: %s", model_id, report)
+    return report
+
+
+def get_export_report(model_id: UUID) -> Optional[Dict]:
+    """Return the export report of a model version, if it was exported."""
+    report_path = get_report_path(model_id)
+    if not path.isfile(report_path):
+        return None
+
+    with open(report_path) as f:
+        return json.load(f)
+
+
+def load_serving_model(model_id: UUID) -> Any:
+    """Load the model used for inference.
+
+    With a shared backbone only the head of the version is loaded. Otherwise
+    the TFLite export is used when quantized serving is enabled and the export
+    passed its accuracy check, then the frozen model when enabled, and the full
+    SavedModel for versions saved without one.
+    """
+    if settings.shared_backbone and path.isfile(get_head_path(model_id)):
+        return load_head_model(model_id)
+
+    if settings.serve_quantized:
+        report = get_export_report(model_id)
+        if report and report["serve"]:
+            return TFLiteModel(get_tflite_path(model_id), settings.warmup_batch_sizes)
+
+    if settings.serve_frozen_graph and path.isfile(get_frozen_path(model_id)):
+        return load_frozen_model(model_id)
+
+    return load_model(model_id)
@@ -0,0 +1,94 @@
+"""On-disk cache of backbone feature activations."""
+
+import hashlib
+import os
+from os import path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from app.constants import ModelConstants
+
+
+def feature_key(image_bytes: bytes, seed: Optional[int] = None) -> str:
+    """Cache key of an image's features for a given augmentation seed."""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    shape = "x".join(str(dim) for dim in ModelConstants.INPUT_IMAGE_SHAPE.value)
+    augmentation = "none" if seed is None else f"seed{seed}"
+
+    return f"{ModelConstants.FEATURE_LAYER.value}-{shape}-{augmentation}-{digest}"
+
+
+class FeatureCache:
+    """Store one ``.npy`` file of feature activations per cache key.
+
+    Entries are opened memory-mapped, so reading a cached dataset only pages
+    in the features that are actually used. The modification time of an entry
+    is its last use, ``prune`` deletes the least recently used entries once the
+    cache exceeds ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> str:
+        return path.join(self.cache_dir, key[-2:], f"{key}.npy")
+
+    def __contains__(self, key: str) -> bool:
+        return path.isfile(self._path(key))
+
+    def touch(self, key: str) -> bool:
+        """Mark an entry as used, returning whether it exists."""
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        file_path = self._path(key)
+        if not path.isfile(file_path):
+            return None
+
+        return np.load(file_path, mmap_mode="r")
+
+    def put(self, key: str, features: np.ndarray) -> None:
+        file_path = self._path(key)
+        os.makedirs(path.dirname(file_path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see partial entries.
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(features, dtype=np.float32))
+        os.replace(tmp_path, file_path)
+
+    def prune(self, keep: Iterable[str] = ()) -> int:
+        """Delete least recently used entries down to the size bound.
+
+        Entries in ``keep``, e.g. those of the dataset being trained on, are
+        never deleted. Returns the number of deleted entries.
+        """
+        keep_names = {f"{key}.npy" for key in keep}
+        entries = []
+        total_bytes = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                stat = os.stat(path.join(root, name))
+                total_bytes += stat.st_size
+                if name not in keep_names:
+                    entries.append((stat.st_mtime, stat.st_size, path.join(root, name)))
+
+        deleted = 0
+        for _, size, file_path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                continue
+            total_bytes -= size
+            deleted += 1
+
+        return deleted
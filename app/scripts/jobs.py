@@ -0,0 +1,278 @@
+"""Background queue for training jobs."""
+
+import asyncio
+import os
+import shutil
+from datetime import datetime, timedelta
+from functools import partial
+from glob import glob
+from logging import getLogger
+from os import path
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.constants import JobStatus, Operations, Quantization, ResponseMessage
+from app.datamodel import crud, models
+from app.datamodel.database import engine
+from app.scripts.db_scripts import (
+    claim_training_job,
+    fail_stale_training_jobs,
+    update_training_job,
+)
+from app.scripts.executors import inference_pool, training_pool
+from app.scripts.lazy_modules import export_module, learning_module
+from app.scripts.model_registry import model_registry
+from app.scripts.version_registry import version_registry
+from app.utils import unzip_data
+
+logger = getLogger(__name__)
+
+
+def get_job_dir(job_uuid: UUID) -> str:
+    """Directory holding the uploaded data of a training job."""
+    return path.join(settings.data_dir, "jobs", str(job_uuid))
+
+
+def get_validation_dir(job_uuid: UUID) -> str:
+    """Directory holding the optional validation archive of a training job."""
+    return path.join(get_job_dir(job_uuid), "validation")
+
+
+def remove_job_dir(job_uuid: UUID) -> None:
+    """Delete the uploaded and extracted data of a finished training job."""
+    shutil.rmtree(get_job_dir(job_uuid), ignore_errors=True)
+
+
+def remove_model_files(model_uuid: UUID) -> None:
+    """Delete the SavedModel of a model and the artifacts exported next to it."""
+    shutil.rmtree(path.join(settings.data_dir, str(model_uuid)), ignore_errors=True)
+    for artifact in glob(path.join(settings.data_dir, f"{model_uuid}.*")):
+        os.remove(artifact)
+
+
+def find_validation_archive(job_uuid: UUID) -> Optional[str]:
+    """Path of the validation archive of a training job, if one was uploaded."""
+    validation_dir = get_validation_dir(job_uuid)
+    if not path.isdir(validation_dir):
+        return None
+
+    archives = sorted(
+        name for name in os.listdir(validation_dir) if name.endswith(".zip")
+    )
+    return path.join(validation_dir, archives[0]) if archives else None
+
+
+def report_progress(job_uuid: UUID, epoch: int, step: int, loss: float) -> None:
+    """Persist training progress, called from within the training process."""
+    with Session(engine) as db:
+        update_training_job(db, job_uuid, epoch=epoch, step=step, loss=loss)
+
+
+def _heartbeat(job_uuid: UUID) -> None:
+    with Session(engine) as db:
+        update_training_job(db, job_uuid, updated_at=datetime.utcnow())
+
+
+def _claim_job() -> Optional[models.TrainingJob]:
+    with Session(engine, expire_on_commit=False) as db:
+        return claim_training_job(db)
+
+
+def _register_model(job: models.TrainingJob, class_indices: Dict) -> None:
+    # /train refuses taken versions, a version submitted twice concurrently
+    # fails here on the unique version
+    with Session(engine) as db:
+        crud.create(
+            db,
+            models.ImageModel,
+            dict(
+                image_model_uuid=job.model_uuid,
+                version=job.model_version,
+                class_map=class_indices,
+            ),
+            commit=False,
+        )
+        crud.create(
+            db,
+            models.Operation,
+            dict(name=Operations.TRAIN, model_uuid=job.model_uuid),
+            commit=False,
+        )
+        update_training_job(db, job.job_uuid, status=JobStatus.SUCCEEDED)
+
+
+def _load_versions() -> None:
+    with Session(engine) as db:
+        version_registry.load(db)
+
+
+def _fail_job(job_uuid: UUID, error: str) -> None:
+    with Session(engine) as db:
+        update_training_job(db, job_uuid, status=JobStatus.FAILED, error=error)
+
+
+class TrainingQueue:
+    """Pool of workers consuming queued training jobs from the database.
+
+    Workers poll the ``training_job`` table and are woken up early when a job
+    is submitted from this process.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        poll_interval: float,
+        heartbeat_interval: float,
+        stale_after: float,
+    ):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self.running = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def recover(self) -> None:
+        """Fail the jobs left running by workers that stopped, e.g. crashed."""
+        stale_before = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        with Session(engine) as db:
+            job_uuids = fail_stale_training_jobs(
+                db, stale_before, ResponseMessage.JOB_INTERRUPTED.value
+            )
+        for job_uuid in job_uuids:
+            logger.warning("Failed interrupted training job %s.", job_uuid)
+            remove_job_dir(job_uuid)
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Wake up idle workers after a job was submitted."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _next_job(self) -> models.TrainingJob:
+        while True:
+            self._wakeup.clear()
+            job = await run_in_threadpool(_claim_job)
+            if job:
+                return job
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._next_job()
+            await self._run(job)
+
+    async def _run(self, job: models.TrainingJob) -> None:
+        logger.info("Starting training job %s.", job.job_uuid)
+        self.running += 1
+        heartbeat = asyncio.create_task(self._heartbeat(job.job_uuid))
+        registered = False
+        try:
+            learning = await learning_module.aload()
+            if learning.supports_zip_streaming():
+                train_data = job.data
+            else:
+                train_data = await training_pool.run(unzip_data, job.data)
+
+            class_indices = await training_pool.run(
+                learning.run_training,
+                train_data,
+                job.model_uuid,
+                partial(report_progress, job.job_uuid),
+            )
+            if settings.quantization != Quantization.NONE:
+                await self._export(job, train_data)
+            await run_in_threadpool(_register_model, job, class_indices)
+            registered = True
+            self.succeeded += 1
+            await self._load_versions(job)
+            await self._warm_up(job)
+
+        except Exception as ex:
+            logger.exception("Training job %s failed.", job.job_uuid)
+            await run_in_threadpool(_fail_job, job.job_uuid, str(ex))
+            self.failed += 1
+            if not registered:
+                await run_in_threadpool(remove_model_files, job.model_uuid)
+
+        finally:
+            heartbeat.cancel()
+            self.running -= 1
+            await run_in_threadpool(remove_job_dir, job.job_uuid)
+
+    async def _heartbeat(self, job_uuid: UUID) -> None:
+        # Marks the job as alive while it runs, including export and warmup
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await run_in_threadpool(_heartbeat, job_uuid)
+            except Exception:
+                logger.exception("Heartbeat of training job %s failed.", job_uuid)
+
+    async def _export(self, job: models.TrainingJob, train_data: str) -> None:
+        # The SavedModel is always usable, a failed export only loses the
+        # optimized artifact.
+        try:
+            learning = await learning_module.aload()
+            export = await export_module.aload()
+            validation_data = find_validation_archive(job.job_uuid)
+            if validation_data and not learning.supports_zip_streaming():
+                validation_data = await training_pool.run(unzip_data, validation_data)
+
+            await training_pool.run(
+                export.export_model, job.model_uuid, train_data, validation_data
+            )
+        except Exception:
+            logger.exception("Export of training job %s failed.", job.job_uuid)
+
+    async def _load_versions(self, job: models.TrainingJob) -> None:
+        # The version is registered, other workers pick it up on their next poll
+        try:
+            await run_in_threadpool(_load_versions)
+        except Exception:
+            logger.exception("Reloading versions after job %s failed.", job.job_uuid)
+
+    async def _warm_up(self, job: models.TrainingJob) -> None:
+        # Load the new version so its first requests don't pay for it
+        try:
+            await inference_pool.run(model_registry.get, job.model_uuid)
+        except Exception:
+            logger.exception("Warmup of training job %s failed.", job.job_uuid)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+        }
+
+
+training_queue = TrainingQueue(
+    workers=settings.training_job_workers,
+    poll_interval=settings.training_job_poll_seconds,
+    heartbeat_interval=settings.training_job_heartbeat_seconds,
+    stale_after=settings.training_job_stale_seconds,
+)
@@ -0,0 +1,48 @@
+"""Modelling modules imported on first use.
+
+Importing TensorFlow takes seconds, so the modules depending on it are only
+imported when a model is first used or by the startup warmup. Coroutines wait
+for the import in a worker thread instead of blocking the event loop.
+"""
+
+import importlib
+from threading import Lock
+from types import ModuleType
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+
+class LazyModule:
+    """Module imported once, on first access."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+        self._module: Optional[ModuleType] = None
+        self._lock = Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self) -> ModuleType:
+        """Return the module, importing it in the calling thread if needed."""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.name)
+
+        return self._module
+
+    async def aload(self) -> ModuleType:
+        """Return the module, importing it in a worker thread if needed."""
+        if self._module is None:
+            await run_in_threadpool(self.load)
+
+        return self._module
+
+
+learning_module = LazyModule("app.scripts.learning")
+export_module = LazyModule("app.scripts.export")
+shared_backbone_module = LazyModule("app.scripts.shared_backbone")
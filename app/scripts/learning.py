@@ -1,45 +1,219 @@
 """File to store model training and test functions."""
 
+import io
+import math
+import os
+import time
+import zipfile
+from logging import getLogger
 from os import path
-from typing import Any, Dict, Tuple
+from threading import Lock
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 from uuid import UUID
 
 import keras
+import numpy as np
+import tensorflow as tf
 from keras import layers, models, optimizers
 from keras.applications.inception_v3 import InceptionV3
 from keras.preprocessing.image import ImageDataGenerator
 from keras.utils.image_utils import img_to_array, load_img
+from PIL import Image
 
 from app.config import settings
-from app.constants import DATA_GENERATOR_PARAMS, ModelConstants
-from app.utils import download_data
+from app.constants import (
+    DATA_GENERATOR_PARAMS,
+    Endpoint,
+    InputPipeline,
+    ModelConstants,
+    TrainingMode,
+)
+from app.scripts.evaluation import StreamingMetrics
+from app.scripts.features import FeatureCache, feature_key
+from app.scripts.metrics import BATCH_SIZE, timed
+from app.scripts.weights import pretrained_weights
+from app.utils import check_zip_limits, list_zip_images
 
-filename = path.basename(ModelConstants.PRETRAINED_WEIGHTS.value)
+logger = getLogger(__name__)
 
+# A class directory or a zip archive of class folders, as a path or file object
+DataSource = Union[str, IO[bytes]]
 
-def create_model() -> Any:
-    """Create a InceptionV3 model."""
-    weights = download_data(filename)
+
+class ProgressCallback(keras.callbacks.Callback):
+    """Report epoch, step and loss at most every ``interval`` seconds.
+
+    The last step of every epoch is always reported.
+    """
+
+    def __init__(self, report: Callable[[int, int, float], None], interval: float):
+        super().__init__()
+        self.report = report
+        self.interval = interval
+        self.epoch = 0
+        self.step = 0
+        self.loss = 0.0
+
+        self._reported_at = 0.0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step = batch
+        self.loss = float((logs or {}).get("loss", 0))
+        if time.monotonic() - self._reported_at >= self.interval:
+            self._report()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self._report()
+
+    def _report(self):
+        self.report(self.epoch, self.step, self.loss)
+        self._reported_at = time.monotonic()
+
+
+class TFLiteModel:
+    """TFLite interpreter exposing the subset of the keras model API we use.
+
+    The interpreter memory-maps the model file read-only. With ``mapped``, the
+    default XNNPACK delegate, which repacks weights into private memory, is
+    left out so the weights of a float model are used in place and their
+    pages are shared by every process serving the same file.
+
+    Resizing an interpreter reallocates its tensors and re-applies the
+    delegate, so one interpreter is kept allocated per size in
+    ``batch_sizes`` and batch size 1. A batch is run in chunks of those
+    sizes, largest first, and never resizes an interpreter.
+    """
+
+    def __init__(self, model_path: str, batch_sizes: List[int], mapped: bool = False):
+        self.model_path = model_path
+        self.batch_sizes = sorted(set(batch_sizes) | {1}, reverse=True)
+        # Mapped interpreters share the file pages, XNNPACK copies the weights
+        self.memory_bytes = path.getsize(model_path) * (
+            1 if mapped else len(self.batch_sizes)
+        )
+
+        op_resolver_type = (
+            tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+            if mapped
+            else tf.lite.experimental.OpResolverType.AUTO
+        )
+        self._interpreters = {
+            batch_size: self._create_interpreter(batch_size, op_resolver_type)
+            for batch_size in self.batch_sizes
+        }
+        # Interpreters are not thread safe
+        self._lock = Lock()
+
+    def _create_interpreter(
+        self, batch_size: int, op_resolver_type: Any
+    ) -> Tuple[Any, int, int]:
+        interpreter = tf.lite.Interpreter(
+            model_path=self.model_path, experimental_op_resolver_type=op_resolver_type
+        )
+        input_details = interpreter.get_input_details()[0]
+        interpreter.resize_tensor_input(
+            input_details["index"], [batch_size, *input_details["shape"][1:]]
+        )
+        interpreter.allocate_tensors()
+
+        return (
+            interpreter,
+            input_details["index"],
+            interpreter.get_output_details()[0]["index"],
+        )
+
+    def predict(self, img: Any, verbose: int = 0) -> np.ndarray:
+        img = np.asarray(img, dtype=np.float32)
+
+        outputs = []
+        with self._lock:
+            start = 0
+            while start < len(img):
+                batch_size = next(
+                    size for size in self.batch_sizes if size <= len(img) - start
+                )
+                interpreter, input_index, output_index = self._interpreters[batch_size]
+                interpreter.set_tensor(input_index, img[start : start + batch_size])
+                interpreter.invoke()
+                outputs.append(interpreter.get_tensor(output_index).copy())
+                start += batch_size
+
+        return np.concatenate(outputs)
+
+
+class FeatureSequence(keras.utils.Sequence):
+    """Batches of cached feature activations and one-hot labels."""
+
+    def __init__(
+        self,
+        cache: FeatureCache,
+        keys: List[str],
+        labels: List[int],
+        num_classes: int,
+        batch_size: int,
+    ):
+        self.cache = cache
+        self.keys = keys
+        self.labels = np.asarray(labels)
+        self.num_classes = num_classes
+        self.batch_size = batch_size
+        self.index = np.random.permutation(len(keys))
+
+    def __len__(self):
+        return math.ceil(len(self.keys) / self.batch_size)
+
+    def __getitem__(self, idx):
+        batch = self.index[idx * self.batch_size : (idx + 1) * self.batch_size]
+        features = np.stack([self.cache.get(self.keys[i]) for i in batch])
+        labels = keras.utils.to_categorical(self.labels[batch], self.num_classes)
+
+        return features, labels
+
+    def on_epoch_end(self):
+        np.random.shuffle(self.index)
+
+
+def create_backbone() -> Any:
+    """Create the frozen InceptionV3 base up to the feature layer."""
     pre_trained_model = InceptionV3(
         input_shape=ModelConstants.INPUT_IMAGE_SHAPE.value,
         include_top=False,
         weights=None,
     )
-    pre_trained_model.load_weights(weights)
+    pretrained_weights.load_into(pre_trained_model)
 
     for layer in pre_trained_model.layers:
         layer.trainable = False
 
-    last_layer = pre_trained_model.get_layer("mixed7")
-    last_layer_output = last_layer.output
+    last_layer = pre_trained_model.get_layer(ModelConstants.FEATURE_LAYER.value)
+
+    return keras.Model(pre_trained_model.input, last_layer.output)
 
-    x = layers.Flatten()(last_layer_output)
+
+def create_head(feature_shape: Tuple) -> Any:
+    """Create the trainable classifier on top of the feature layer."""
+    inputs = layers.Input(shape=feature_shape)
+    x = layers.Flatten()(inputs)
     x = layers.Dense(1024, activation="relu")(x)
     x = layers.Dropout(0.2)(x)
     x = layers.Dense(2, activation="softmax")(x)
 
-    model = keras.Model(pre_trained_model.input, x)
+    return keras.Model(inputs, x)
+
+
+def attach_head(backbone: Any, head: Any) -> Any:
+    """Apply the head layers on the backbone output as a single flat model."""
+    x = backbone.output
+    for layer in head.layers[1:]:
+        x = layer(x)
+
+    return keras.Model(backbone.input, x)
 
+
+def compile_model(model: Any) -> Any:
     model.compile(
         optimizer=optimizers.RMSprop(lr=0.01),
         loss="categorical_crossentropy",
@@ -49,63 +223,501 @@ def create_model() -> Any:
     return model
 
 
-def train_model(model: Any, train_data_dir: str) -> Tuple[Any, Dict]:
+def create_model() -> Any:
+    """Create a InceptionV3 model."""
+    backbone = create_backbone()
+    head = create_head(backbone.output_shape[1:])
+
+    return compile_model(attach_head(backbone, head))
+
+
+def train_model(
+    model: Any, train_data: DataSource, callbacks: Optional[List] = None
+) -> Tuple[Any, Dict]:
     """Train model and return model and class mapping."""
-    train_datagen = ImageDataGenerator(**DATA_GENERATOR_PARAMS)
-    train_generator = train_datagen.flow_from_directory(
-        train_data_dir,
-        target_size=tuple(ModelConstants.INPUT_IMAGE_SHAPE.value[:2]),
-        batch_size=ModelConstants.BATCH_SIZE.value,
-        class_mode="categorical",
+    train_data, class_indices = load_dataset(
+        train_data, augment=True, cache=settings.input_cache, repeat=True
     )
 
     model.fit(
-        train_generator,
-        steps_per_epoch=10,
-        epochs=4,
+        train_data,
+        steps_per_epoch=ModelConstants.STEPS_PER_EPOCH.value,
+        epochs=ModelConstants.EPOCHS.value,
         verbose=1,
+        callbacks=callbacks,
+    )
+
+    return model, class_indices
+
+
+def list_image_files(data_dir: str) -> Tuple[List[str], List[int], Dict]:
+    """List images in class sub-directories, labelled like flow_from_directory."""
+    classes = sorted(
+        name for name in os.listdir(data_dir) if path.isdir(path.join(data_dir, name))
+    )
+    class_indices = {class_name: idx for idx, class_name in enumerate(classes)}
+
+    files, labels = [], []
+    for class_name in classes:
+        for root, _, names in sorted(os.walk(path.join(data_dir, class_name))):
+            for name in sorted(names):
+                if name.lower().endswith(ModelConstants.IMAGE_EXTENSIONS.value):
+                    files.append(path.join(root, name))
+                    labels.append(class_indices[class_name])
+
+    return files, labels, class_indices
+
+
+def is_directory(data_source: DataSource) -> bool:
+    return isinstance(data_source, (str, os.PathLike)) and path.isdir(data_source)
+
+
+def supports_zip_streaming() -> bool:
+    """Whether uploaded archives can be read without extracting them first."""
+    return (
+        settings.stream_zip_ingestion
+        and settings.input_pipeline == InputPipeline.TF_DATA
+    )
+
+
+def get_class_indices(data_source: DataSource) -> Dict:
+    """Class mapping of a class directory or zip archive."""
+    if is_directory(data_source):
+        return list_image_files(data_source)[2]
+
+    with zipfile.ZipFile(data_source) as zip_ref:
+        return list_zip_images(zip_ref)[2]
+
+
+def iter_labelled_images(
+    data_source: DataSource, shuffle: bool = False
+) -> Iterator[Tuple[bytes, int]]:
+    """Yield encoded bytes and label of every image in a directory or zip archive.
+
+    Archive members are read one by one without extracting them to disk. With
+    ``shuffle``, the images are read in a new random order on every call.
+    """
+    if is_directory(data_source):
+        files, labels, _ = list_image_files(data_source)
+        for index in read_order(len(files), shuffle):
+            with open(files[index], "rb") as f:
+                yield f.read(), labels[index]
+        return
+
+    with zipfile.ZipFile(data_source) as zip_ref:
+        check_zip_limits(zip_ref)
+        names, labels, _ = list_zip_images(zip_ref)
+        for index in read_order(len(names), shuffle):
+            yield zip_ref.read(names[index]), labels[index]
+
+
+def read_order(count: int, shuffle: bool) -> Any:
+    return np.random.permutation(count) if shuffle else range(count)
+
+
+def build_augmentation(params: Dict) -> Any:
+    """Vectorized equivalent of the ImageDataGenerator augmentation parameters.
+
+    Shear has no preprocessing layer counterpart and is not applied.
+    """
+    fill_mode = params.get("fill_mode", "nearest")
+    augmentation = []
+
+    if params.get("rotation_range"):
+        augmentation.append(
+            layers.RandomRotation(params["rotation_range"] / 360, fill_mode=fill_mode)
+        )
+    if params.get("width_shift_range") or params.get("height_shift_range"):
+        augmentation.append(
+            layers.RandomTranslation(
+                params.get("height_shift_range", 0),
+                params.get("width_shift_range", 0),
+                fill_mode=fill_mode,
+            )
+        )
+    if params.get("zoom_range"):
+        augmentation.append(
+            layers.RandomZoom(params["zoom_range"], fill_mode=fill_mode)
+        )
+    if params.get("horizontal_flip"):
+        augmentation.append(layers.RandomFlip("horizontal"))
+
+    return keras.Sequential(augmentation)
+
+
+def decode_image(contents: Any) -> Any:
+    """Decode, resize and rescale an encoded image."""
+    img = tf.io.decode_image(contents, channels=3, expand_animations=False)
+    img = tf.image.resize(
+        img, ModelConstants.INPUT_IMAGE_SHAPE.value[:2], method="nearest"
     )
 
-    return model, train_generator.class_indices
+    return tf.cast(img, tf.float32) * DATA_GENERATOR_PARAMS["rescale"]
+
+
+def build_dataset(
+    data_source: DataSource,
+    augment: bool = True,
+    shuffle: bool = True,
+    cache: bool = False,
+    repeat: bool = False,
+    batch_size: int = ModelConstants.BATCH_SIZE.value,
+) -> Tuple[Any, Dict]:
+    """Build a parallel, prefetching tf.data pipeline over a directory or archive.
+
+    Returns the batched dataset of images and one-hot labels along with the
+    same class mapping flow_from_directory would produce. Images are shuffled
+    by file before they are decoded. With ``cache``, every decoded image is
+    kept in memory, and the cached order is mixed by a small shuffle buffer.
+    """
+    if is_directory(data_source):
+        files, labels, class_indices = list_image_files(data_source)
+        dataset = tf.data.Dataset.from_tensor_slices((files, labels))
+        if shuffle:
+            dataset = dataset.shuffle(max(1, len(files)), reshuffle_each_iteration=True)
+        dataset = dataset.map(
+            lambda img_path, label: (tf.io.read_file(img_path), label),
+            num_parallel_calls=tf.data.AUTOTUNE,
+        )
+    else:
+        class_indices = get_class_indices(data_source)
+        dataset = tf.data.Dataset.from_generator(
+            lambda: iter_labelled_images(data_source, shuffle=shuffle),
+            output_signature=(
+                tf.TensorSpec(shape=(), dtype=tf.string),
+                tf.TensorSpec(shape=(), dtype=tf.int32),
+            ),
+        )
+
+    dataset = dataset.map(
+        lambda contents, label: (
+            decode_image(contents),
+            tf.one_hot(label, len(class_indices)),
+        ),
+        num_parallel_calls=tf.data.AUTOTUNE,
+    )
+    if cache:
+        dataset = dataset.cache()
+    if repeat:
+        dataset = dataset.repeat()
+    if shuffle and cache:
+        dataset = dataset.shuffle(ModelConstants.SHUFFLE_BUFFER_SIZE.value)
+    dataset = dataset.batch(batch_size)
+
+    if augment:
+        augmentation = build_augmentation(DATA_GENERATOR_PARAMS)
+        dataset = dataset.map(
+            lambda img, label: (augmentation(img, training=True), label),
+            num_parallel_calls=tf.data.AUTOTUNE,
+        )
+
+    return dataset.prefetch(tf.data.AUTOTUNE), class_indices
+
 
+def load_dataset(
+    data_source: DataSource,
+    augment: bool = True,
+    shuffle: bool = True,
+    cache: bool = False,
+    repeat: bool = False,
+    batch_size: int = ModelConstants.BATCH_SIZE.value,
+    pipeline: Optional[str] = None,
+) -> Tuple[Any, Dict]:
+    """Load a class directory or zip archive with the configured input pipeline."""
+    if (pipeline or settings.input_pipeline) == InputPipeline.TF_DATA:
+        return build_dataset(
+            data_source,
+            augment=augment,
+            shuffle=shuffle,
+            cache=cache,
+            repeat=repeat,
+            batch_size=batch_size,
+        )
 
-def evaluate_model(model: Any, test_data_dir: str) -> Dict:
-    """Evaluate model and return scores."""
-    evaluation_datagen = ImageDataGenerator(**DATA_GENERATOR_PARAMS)
-    eval_generator = evaluation_datagen.flow_from_directory(
-        test_data_dir,
+    if not is_directory(data_source):
+        raise ValueError("The generator input pipeline needs an extracted directory.")
+
+    params = (
+        DATA_GENERATOR_PARAMS
+        if augment
+        else dict(rescale=DATA_GENERATOR_PARAMS["rescale"])
+    )
+    generator = ImageDataGenerator(**params).flow_from_directory(
+        data_source,
         target_size=tuple(ModelConstants.INPUT_IMAGE_SHAPE.value[:2]),
-        batch_size=ModelConstants.BATCH_SIZE.value,
+        batch_size=batch_size,
         class_mode="categorical",
+        shuffle=shuffle,
     )
 
-    score = model.evaluate_generator(eval_generator, steps=10)
-    return score
+    return generator, generator.class_indices
 
 
-def preprocess_img(img_path: str) -> Any:
-    """Preprocess image for prediction."""
+def load_training_image(
+    image_bytes: bytes, datagen: ImageDataGenerator, seed: Optional[int] = None
+) -> Any:
+    """Load an image, apply the seeded random augmentation and rescale it."""
     img = load_img(
-        img_path, target_size=tuple(ModelConstants.INPUT_IMAGE_SHAPE.value[:2])
+        io.BytesIO(image_bytes),
+        target_size=tuple(ModelConstants.INPUT_IMAGE_SHAPE.value[:2]),
     )
     img = img_to_array(img)
-    img = img.reshape((1, img.shape[0], img.shape[1], img.shape[2]))
-    img = img / 255
+    if seed is not None:
+        img = datagen.random_transform(img, seed=seed)
+
+    return datagen.standardize(img)
+
+
+def cache_features(
+    backbone: Any,
+    datagen: ImageDataGenerator,
+    cache: FeatureCache,
+    pending: List[Tuple[str, bytes, Optional[int]]],
+) -> None:
+    """Run a batch of (key, image bytes, seed) entries through the backbone."""
+    batch = np.stack(
+        [
+            load_training_image(image_bytes, datagen, seed)
+            for _, image_bytes, seed in pending
+        ]
+    )
+    outputs = backbone.predict(batch, verbose=0)
+    for (key, _, _), output in zip(pending, outputs):
+        cache.put(key, output)
+
+
+def extract_features(
+    backbone: Any,
+    train_data: DataSource,
+    cache: FeatureCache,
+    augmentation_copies: int = 0,
+) -> Tuple[List[str], List[int], Dict]:
+    """Compute and cache backbone features of every training image.
+
+    Each image contributes one un-augmented entry plus ``augmentation_copies``
+    entries with fixed augmentation seeds. Only entries missing from the cache
+    are run through the backbone.
+    """
+    datagen = ImageDataGenerator(**DATA_GENERATOR_PARAMS)
+    seeds = [None] + list(range(augmentation_copies))
+
+    keys, labels, pending = [], [], []
+    for image_bytes, label in iter_labelled_images(train_data):
+        for seed in seeds:
+            key = feature_key(image_bytes, seed)
+            keys.append(key)
+            labels.append(label)
+            if not cache.touch(key):
+                pending.append((key, image_bytes, seed))
+
+        if len(pending) >= ModelConstants.BATCH_SIZE.value:
+            cache_features(backbone, datagen, cache, pending)
+            pending = []
+
+    if pending:
+        cache_features(backbone, datagen, cache, pending)
+
+    return keys, labels, get_class_indices(train_data)
+
+
+def train_bottleneck_model(
+    train_data: DataSource, callbacks: Optional[List] = None
+) -> Tuple[Any, Dict]:
+    """Train the head on cached features and return the full model and class mapping."""
+    backbone = create_backbone()
+    head = compile_model(create_head(backbone.output_shape[1:]))
+
+    cache = FeatureCache(settings.feature_cache_dir, settings.feature_cache_max_bytes)
+    keys, labels, class_indices = extract_features(
+        backbone, train_data, cache, settings.feature_augmentation_copies
+    )
+
+    head.fit(
+        FeatureSequence(
+            cache,
+            keys,
+            labels,
+            num_classes=head.output_shape[-1],
+            batch_size=ModelConstants.BATCH_SIZE.value,
+        ),
+        epochs=ModelConstants.EPOCHS.value,
+        verbose=1,
+        callbacks=callbacks,
+    )
+
+    # Bound the cache once this dataset's entries are no longer read
+    deleted = cache.prune(keep=keys)
+    if deleted:
+        logger.info("Deleted %d least recently used cached features.", deleted)
+
+    return compile_model(attach_head(backbone, head)), class_indices
+
+
+def evaluate_model(model: Any, test_data: DataSource) -> Dict:
+    """Evaluate model on the whole dataset and return metrics.
+
+    Images are streamed once, without augmentation or caching, so memory use
+    does not grow with the dataset size.
+    """
+    eval_data, class_indices = load_dataset(
+        test_data,
+        augment=False,
+        shuffle=False,
+        cache=False,
+        batch_size=ModelConstants.EVAL_BATCH_SIZE.value,
+    )
+    batches = eval_data
+    if isinstance(eval_data, keras.utils.Sequence):
+        # Keras directory iterators loop forever, stop after one pass
+        batches = (eval_data[idx] for idx in range(len(eval_data)))
+
+    metrics = StreamingMetrics(len(class_indices))
+    for img, labels in batches:
+        BATCH_SIZE.labels(Endpoint.EVALUATE).observe(len(img))
+        with timed(Endpoint.EVALUATE, "inference"):
+            outputs = model.predict(img, verbose=0)
+        metrics.update(labels, outputs)
+
+    return metrics.result(class_indices)
+
+
+def preprocess_bytes(image_bytes: bytes, out: Optional[np.ndarray] = None) -> Any:
+    """Preprocess an encoded image for prediction without touching the disk.
+
+    The resized pixels are rescaled straight into ``out``, a float32 buffer of
+    shape (1, height, width, 3), which is allocated when not given.
+    """
+    height, width, channels = ModelConstants.INPUT_IMAGE_SHAPE.value
+    if out is None:
+        out = np.empty((1, height, width, channels), dtype=np.float32)
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # PIL only warns below twice its pixel limit, such images aren't decoded
+        if Image.MAX_IMAGE_PIXELS and img.width * img.height > Image.MAX_IMAGE_PIXELS:
+            raise Image.DecompressionBombError(
+                f"Image of {img.width}x{img.height} pixels exceeds the limit."
+            )
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if img.size != (width, height):
+            img = img.resize((width, height), Image.NEAREST)
+        pixels = np.asarray(img, dtype=np.uint8)
+
+    np.multiply(pixels, np.float32(DATA_GENERATOR_PARAMS["rescale"]), out=out[0])
+
+    return out
 
-    return img
 
+def make_batch_prediction(model: Any, img_paths: List[str]) -> Tuple[List, Any]:
+    """Make predictions for image paths, skipping unreadable images.
+
+    Returns the paths that could be read along with their output rows.
+    """
+    batch = np.empty(
+        (len(img_paths), *ModelConstants.INPUT_IMAGE_SHAPE.value), dtype=np.float32
+    )
+    valid_paths = []
+    with timed(Endpoint.PREDICT_BATCH, "preprocess"):
+        for img_path in img_paths:
+            try:
+                with open(img_path, "rb") as f:
+                    row = len(valid_paths)
+                    preprocess_bytes(f.read(), out=batch[row : row + 1])
+                valid_paths.append(img_path)
+            except (OSError, Image.DecompressionBombError):
+                logger.warning("Skipping unreadable image %s", img_path)
+
+    if not valid_paths:
+        return valid_paths, []
+
+    BATCH_SIZE.labels(Endpoint.PREDICT_BATCH).observe(len(valid_paths))
+    with timed(Endpoint.PREDICT_BATCH, "inference"):
+        return valid_paths, model.predict(batch[: len(valid_paths)], verbose=0)
+
+
+def run_training(
+    train_data: DataSource,
+    model_id: UUID,
+    report_progress: Optional[Callable[[int, int, float], None]] = None,
+) -> Dict:
+    """Create, train and save a model, returning its class mapping.
+
+    Kept as a module level function so it can be dispatched to a worker process.
+    """
+    callbacks = (
+        [ProgressCallback(report_progress, settings.training_progress_seconds)]
+        if report_progress
+        else None
+    )
+    if settings.training_mode == TrainingMode.BOTTLENECK:
+        model, class_indices = train_bottleneck_model(train_data, callbacks)
+    else:
+        model = create_model()
+        model, class_indices = train_model(model, train_data, callbacks)
+    save_model(model, model_id)
+
+    return class_indices
 
-def make_prediction(model: Any, img_path: str) -> Any:
-    """Make prediction for given image path."""
-    img = preprocess_img(img_path)
-    return model.predict(img)
+
+def get_frozen_path(model_id: UUID) -> str:
+    """Path of the frozen serving model, stored next to the SavedModel."""
+    return path.join(settings.data_dir, f"{model_id}.float.tflite")
+
+
+def freeze_model(model: Any) -> bytes:
+    """Convert the model to a float TFLite flatbuffer for serving.
+
+    The converter folds the weights into constants, including batch
+    normalization into the convolutions, and keeps only the layers reachable
+    from the output, i.e. the backbone up to the feature layer and the head.
+    """
+    return tf.lite.TFLiteConverter.from_keras_model(model).convert()
+
+
+def get_head_path(model_id: UUID) -> str:
+    """Path of the classifier head of a model, stored next to the SavedModel."""
+    return path.join(settings.data_dir, f"{model_id}.head.h5")
+
+
+def extract_head(model: Any) -> Any:
+    """Copy the layers after the feature layer of a flat model into a head."""
+    feature_layer = model.get_layer(ModelConstants.FEATURE_LAYER.value)
+    head = create_head(feature_layer.output_shape[1:])
+
+    head_layers = model.layers[model.layers.index(feature_layer) + 1 :]
+    head.set_weights([w for layer in head_layers for w in layer.get_weights()])
+
+    return head
 
 
 def save_model(model: Any, model_id: UUID):
-    """Save model to data dir"""
-    model.save(path.join(settings.data_dir, str(model_id)))
+    """Save model to data dir, along with its frozen serving model and head."""
+    # Models are never trained further, so optimizer slots are not kept
+    model.save(path.join(settings.data_dir, str(model_id)), include_optimizer=False)
+
+    frozen_path = get_frozen_path(model_id)
+    tmp_path = f"{frozen_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(freeze_model(model))
+    os.replace(tmp_path, frozen_path)
+
+    extract_head(model).save(get_head_path(model_id), include_optimizer=False)
 
 
 def load_model(model_id: UUID):
     """Load model."""
     return models.load_model(path.join(settings.data_dir, str(model_id)))
+
+
+def load_head(model_id: UUID) -> Any:
+    """Load the classifier head of a model."""
+    return models.load_model(get_head_path(model_id), compile=False)
+
+
+def load_frozen_model(model_id: UUID) -> TFLiteModel:
+    """Load the frozen serving model of a model."""
+    return TFLiteModel(
+        get_frozen_path(model_id),
+        settings.warmup_batch_sizes,
+        mapped=settings.mmap_weights,
+    )
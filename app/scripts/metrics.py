@@ -0,0 +1,176 @@
+"""Prometheus metrics of the request stages and serving components.
+
+Metrics are kept per worker process in the default registry, which also
+exports the process CPU time and resident memory.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from prometheus_client import REGISTRY, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+REQUEST_SECONDS = Histogram(
+    "mlapp_request_seconds",
+    "Time to answer a modelling request.",
+    ["endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "mlapp_stage_seconds",
+    "Time spent in a stage of a modelling request.",
+    ["endpoint", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "mlapp_batch_size",
+    "Images per forward pass.",
+    ["endpoint"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+UPLOAD_BYTES = Histogram(
+    "mlapp_upload_bytes",
+    "Size of uploaded files.",
+    ["endpoint"],
+    buckets=tuple(4**exponent * 1024 for exponent in range(12)),
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "mlapp_model_load_seconds",
+    "Time to load and warm up a model version.",
+    buckets=LATENCY_BUCKETS,
+)
+
+# Stage timings of the current request, only collected when they are reported
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def record_stage(endpoint: str, stage: str, seconds: float) -> None:
+    """Record the time spent in a stage of the current request."""
+    STAGE_SECONDS.labels(endpoint, stage).observe(seconds)
+
+    timings = request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0) + seconds
+
+
+@contextmanager
+def timed(endpoint: str, stage: str) -> Iterator[None]:
+    """Record the time spent in a stage of a request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(endpoint, stage, time.perf_counter() - start)
+
+
+class StatsCollector:
+    """Expose the numeric values of a component's stats as gauges.
+
+    With ``label``, the stats are a mapping of names, e.g. pools or endpoints,
+    to their own stats, and the name is exported as that label.
+    """
+
+    def __init__(self, prefix: str, stats: Callable[[], Dict], label: str = ""):
+        self.prefix = prefix
+        self.stats = stats
+        self.label = label
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        stats = self.stats()
+        rows = stats.items() if self.label else [("", stats)]
+
+        families: Dict[str, GaugeMetricFamily] = {}
+        for name, values in rows:
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+
+                metric = f"mlapp_{self.prefix}_{key}"
+                if metric not in families:
+                    families[metric] = GaugeMetricFamily(
+                        metric,
+                        f"{key} of {self.prefix}.",
+                        labels=[self.label] if self.label else None,
+                    )
+                families[metric].add_metric([name] if self.label else [], value)
+
+        return iter(families.values())
+
+
+def register_stats(prefix: str, stats: Callable[[], Dict], label: str = "") -> None:
+    """Export the stats of a serving component on /metrics."""
+    REGISTRY.register(StatsCollector(prefix, stats, label))
+
+
+class RequestMetrics:
+    """ASGI middleware timing the requests to the given endpoints.
+
+    With ``timing_header``, the stage timings of each request are returned in
+    a ``Server-Timing`` header, in milliseconds.
+    """
+
+    def __init__(self, app: Callable, endpoints: Dict[str, str], timing_header: bool):
+        self.app = app
+        self.endpoints = endpoints
+        self.timing_header = timing_header
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        endpoint = (
+            self.endpoints.get(scope["path"]) if scope["type"] == "http" else None
+        )
+        if endpoint is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        timings: Optional[Dict[str, float]] = None
+        if self.timing_header:
+            timings = {}
+            request_timings.set(timings)
+
+        async def send_with_metrics(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if timings is not None:
+                    timings["total"] = time.perf_counter() - start
+                    header = ", ".join(
+                        f"{stage};dur={seconds * 1000:.2f}"
+                        for stage, seconds in timings.items()
+                    )
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"server-timing", header.encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            REQUEST_SECONDS.labels(endpoint, str(status_code)).observe(
+                time.perf_counter() - start
+            )
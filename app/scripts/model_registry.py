@@ -0,0 +1,189 @@
+"""In-process registry of loaded models."""
+
+import time
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.constants import ModelConstants
+from app.scripts.db_scripts import get_model_details
+from app.scripts.lazy_modules import export_module
+from app.scripts.metrics import MODEL_LOAD_SECONDS
+
+logger = getLogger(__name__)
+
+
+def estimate_model_bytes(model: Any) -> int:
+    """Estimate memory held by the weights of a loaded model."""
+    if hasattr(model, "memory_bytes"):
+        return int(model.memory_bytes)
+
+    return sum(
+        weight.shape.num_elements() * weight.dtype.size
+        for weight in getattr(model, "weights", [])
+    )
+
+
+def warm_up_model(model: Any, batch_sizes: List[int]) -> None:
+    """Run dummy batches through a model.
+
+    The first calls of a freshly loaded model pay for graph tracing and kernel
+    initialization, which would otherwise land on its first requests.
+    """
+    for batch_size in batch_sizes:
+        batch = np.zeros(
+            (batch_size, *ModelConstants.INPUT_IMAGE_SHAPE.value), dtype=np.float32
+        )
+        model.predict(batch, verbose=0)
+
+
+def load_serving_model(model_id: UUID) -> Any:
+    """Load and warm up the model used for inference."""
+    model = export_module.load().load_serving_model(model_id)
+
+    start = time.perf_counter()
+    warm_up_model(model, settings.warmup_batch_sizes)
+    logger.info("Warmed up model %s in %.2f s.", model_id, time.perf_counter() - start)
+
+    return model
+
+
+class ModelRegistry:
+    """LRU cache of loaded models keyed by image model uuid.
+
+    The registry is bounded both by the number of resident models and by the
+    estimated memory of their weights; the least recently used model is
+    evicted first when either bound is exceeded.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[UUID], Any],
+        max_models: int,
+        max_bytes: int,
+    ):
+        self.loader = loader
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+
+        self._models: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = Lock()
+        self._loading: Dict[str, Lock] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+            return model
+
+    def get(self, model_id: UUID) -> Any:
+        """Return a loaded model, loading it on a cache miss."""
+        key = str(model_id)
+        model = self._lookup(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            key_lock = self._loading.setdefault(key, Lock())
+
+        # Concurrent misses on the same version wait for a single load.
+        try:
+            with key_lock:
+                model = self._lookup(key)
+                if model is not None:
+                    return model
+
+                with self._lock:
+                    self.misses += 1
+                with MODEL_LOAD_SECONDS.time():
+                    model = self.loader(model_id)
+                self.put(model_id, model)
+        finally:
+            with self._lock:
+                if self._loading.get(key) is key_lock:
+                    del self._loading[key]
+
+        return model
+
+    def put(self, model_id: UUID, model: Any) -> None:
+        """Insert a loaded model and evict until within bounds."""
+        key = str(model_id)
+        size = estimate_model_bytes(model)
+
+        with self._lock:
+            self._models[key] = model
+            self._sizes[key] = size
+            self._models.move_to_end(key)
+            self._evict()
+
+    def _evict(self) -> None:
+        # The most recently inserted model is always kept, even if it alone
+        # exceeds the memory bound.
+        while len(self._models) > 1 and (
+            len(self._models) > self.max_models or self.total_bytes > self.max_bytes
+        ):
+            key, _ = self._models.popitem(last=False)
+            self._sizes.pop(key, None)
+            self.evictions += 1
+            logger.info("Evicted model %s from registry.", key)
+
+    def invalidate(self, model_id: UUID) -> bool:
+        """Drop a model from the registry."""
+        key = str(model_id)
+        with self._lock:
+            self._sizes.pop(key, None)
+            return self._models.pop(key, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._sizes.clear()
+
+    def preload(self, db: Session, count: int) -> None:
+        """Load the most recently created model versions."""
+        if count <= 0:
+            return
+
+        model_details = sorted(
+            get_model_details(db), key=lambda row: row.created_at, reverse=True
+        )
+        for row in model_details[:count]:
+            logger.info("Preloading model version %s.", row.version)
+            self.get(row.image_model_uuid)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "models": list(self._models),
+                "size": len(self._models),
+                "bytes": self.total_bytes,
+                "max_models": self.max_models,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+model_registry = ModelRegistry(
+    loader=load_serving_model,
+    max_models=settings.model_cache_size,
+    max_bytes=settings.model_cache_max_bytes,
+)
@@ -0,0 +1,118 @@
+"""Cache of prediction results keyed by model and image content hash."""
+
+import time
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.datamodel.database import engine
+from app.scripts.db_scripts import get_cached_prediction, save_cached_prediction
+
+logger = getLogger(__name__)
+
+
+class PredictionCache:
+    """In-memory LRU of predicted classes with TTL expiry.
+
+    When ``persist`` is set, entries are also written to the
+    ``prediction_cache`` table so they survive restarts and are shared between
+    worker processes; the table is only consulted on a memory miss. A failed
+    table write is logged, the prediction itself was answered already.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, persist: bool = False):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.write_errors = 0
+
+    def _get_memory(self, key: Tuple[str, str]) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            output, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+
+            self._entries.move_to_end(key)
+            return output
+
+    def _put_memory(self, key: Tuple[str, str], output: str) -> None:
+        with self._lock:
+            self._entries[key] = (output, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _load(self, model_id: UUID, image_hash: str) -> Optional[str]:
+        with Session(engine) as db:
+            return get_cached_prediction(db, model_id, image_hash, self.ttl_seconds)
+
+    def _save(self, model_id: UUID, image_hash: str, output: str) -> None:
+        with Session(engine) as db:
+            save_cached_prediction(db, model_id, image_hash, output)
+
+    async def get(self, model_id: UUID, image_hash: str) -> Optional[str]:
+        """Return the cached class of an image for a model version."""
+        key = (str(model_id), image_hash)
+        output = self._get_memory(key)
+
+        if output is None and self.persist:
+            output = await run_in_threadpool(self._load, model_id, image_hash)
+            if output is not None:
+                self._put_memory(key, output)
+
+        if output is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return output
+
+    async def put(self, model_id: UUID, image_hash: str, output: str) -> None:
+        self._put_memory((str(model_id), image_hash), output)
+        if self.persist:
+            try:
+                await run_in_threadpool(self._save, model_id, image_hash, output)
+            except Exception:
+                self.write_errors += 1
+                logger.exception("Saving a cached prediction of %s failed.", model_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "write_errors": self.write_errors,
+        }
+
+
+prediction_cache = PredictionCache(
+    max_size=settings.prediction_cache_size,
+    ttl_seconds=settings.prediction_cache_ttl_seconds,
+    persist=settings.prediction_cache_persist,
+)
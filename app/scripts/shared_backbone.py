@@ -0,0 +1,71 @@
+"""Serving with one backbone shared by every model version."""
+
+from threading import Lock
+from typing import Any, Optional
+from uuid import UUID
+
+import numpy as np
+import tensorflow as tf
+
+from app.constants import ModelConstants
+from app.scripts.learning import create_backbone, load_head
+
+
+class Backbone:
+    """Frozen feature extractor traced once for inference."""
+
+    def __init__(self, model: Any):
+        self.model = model
+        self._call = tf.function(
+            lambda img: model(img, training=False),
+            input_signature=[
+                tf.TensorSpec(
+                    (None, *ModelConstants.INPUT_IMAGE_SHAPE.value), tf.float32
+                )
+            ],
+        )
+
+    def predict(self, img: Any, verbose: int = 0) -> np.ndarray:
+        return self._call(tf.convert_to_tensor(img, dtype=tf.float32)).numpy()
+
+
+_backbone: Optional[Backbone] = None
+_backbone_lock = Lock()
+
+
+def get_backbone() -> Backbone:
+    """Return the process wide backbone, loading it on first use."""
+    global _backbone
+    with _backbone_lock:
+        if _backbone is None:
+            _backbone = Backbone(create_backbone())
+
+    return _backbone
+
+
+class HeadModel:
+    """Classifier head of a model version run on top of the shared backbone.
+
+    Only the head weights count towards the registry memory bound, so many
+    versions can be resident next to a single backbone.
+    """
+
+    def __init__(self, head: Any):
+        self.head = head
+        self.weights = head.weights
+        self._call = tf.function(
+            lambda features: head(features, training=False),
+            input_signature=[tf.TensorSpec(head.input_shape, tf.float32)],
+        )
+
+    def predict_features(self, features: Any) -> np.ndarray:
+        """Predict from backbone features."""
+        return self._call(tf.convert_to_tensor(features, dtype=tf.float32)).numpy()
+
+    def predict(self, img: Any, verbose: int = 0) -> np.ndarray:
+        return self.predict_features(get_backbone().predict(img))
+
+
+def load_head_model(model_id: UUID) -> HeadModel:
+    """Load the head of a model version for shared backbone serving."""
+    return HeadModel(load_head(model_id))
@@ -0,0 +1,144 @@
+"""In-process registry of model version metadata."""
+
+import asyncio
+import time
+from datetime import datetime
+from logging import getLogger
+from threading import Lock
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.datamodel.database import engine
+from app.scripts.db_scripts import get_model_versions, get_model_versions_marker
+
+logger = getLogger(__name__)
+
+
+class ModelVersion(NamedTuple):
+    """Metadata of a trained model version."""
+
+    image_model_uuid: UUID
+    version: str
+    created_at: datetime
+    # Output index to class name
+    classes: Dict[int, str]
+
+
+class VersionRegistry:
+    """Map of model version names to their uuid and decoded class map.
+
+    Versions are loaded once and reloaded when the number of versions or the
+    time the last one was created changes. That marker is polled at most every
+    ``poll_interval`` seconds, and when an unknown version is requested at most
+    every ``miss_refresh_interval`` seconds, so versions trained by other
+    workers are picked up without letting unknown versions flood the database.
+    """
+
+    def __init__(self, poll_interval: float, miss_refresh_interval: float):
+        self.poll_interval = poll_interval
+        self.miss_refresh_interval = miss_refresh_interval
+
+        self._versions: Dict[str, ModelVersion] = {}
+        self._marker: Optional[Tuple[int, Optional[datetime]]] = None
+        self._checked_at = float("-inf")
+        self._lock = Lock()
+        self._refresh_lock = Lock()
+        self._pending: Optional[asyncio.Future] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def load(self, db: Session) -> None:
+        """Load every model version from the database."""
+        # Read the marker first, versions created meanwhile trigger a reload
+        marker = tuple(get_model_versions_marker(db))
+        versions = {
+            row.version: ModelVersion(
+                image_model_uuid=row.image_model_uuid,
+                version=row.version,
+                created_at=row.created_at,
+                classes={index: name for name, index in row.class_map.items()},
+            )
+            for row in get_model_versions(db)
+        }
+
+        with self._lock:
+            self._versions = versions
+            self._marker = marker
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+
+        logger.info("Loaded %d model versions.", len(versions))
+
+    def _is_stale(self, max_age: float) -> bool:
+        return time.monotonic() - self._checked_at >= max_age
+
+    def refresh(self, max_age: float) -> None:
+        """Reload the versions if they changed, checked at most every max_age."""
+        # Concurrent callers wait for a single check
+        with self._refresh_lock:
+            if not self._is_stale(max_age):
+                return
+
+            with Session(engine) as db:
+                if tuple(get_model_versions_marker(db)) != self._marker:
+                    self.load(db)
+                else:
+                    self._checked_at = time.monotonic()
+
+    async def _refresh(self, max_age: float) -> None:
+        if not self._is_stale(max_age):
+            return
+
+        # Concurrent callers share one check instead of queueing threads
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(
+                run_in_threadpool(self.refresh, max_age)
+            )
+            self._pending.add_done_callback(self._refresh_done)
+        await asyncio.shield(self._pending)
+
+    def _refresh_done(self, future: asyncio.Future) -> None:
+        self._pending = None
+
+    async def get(self, version: str) -> Optional[ModelVersion]:
+        """Return a model version, or None if it does not exist."""
+        await self._refresh(self.poll_interval)
+        model_version = self._versions.get(version)
+
+        if model_version is None:
+            # The version may have been trained since the last check
+            await self._refresh(self.miss_refresh_interval)
+            model_version = self._versions.get(version)
+
+        if model_version is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return model_version
+
+    async def all(self) -> List[ModelVersion]:
+        """Return every model version, oldest first."""
+        await self._refresh(self.poll_interval)
+        return list(self._versions.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._versions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "poll_interval": self.poll_interval,
+        }
+
+
+version_registry = VersionRegistry(
+    poll_interval=settings.version_poll_seconds,
+    miss_refresh_interval=settings.version_miss_refresh_seconds,
+)
@@ -0,0 +1,162 @@
+"""Readiness of the service and warmup of the modelling stack."""
+
+import asyncio
+import time
+from logging import getLogger
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.constants import ResponseMessage, StartupStep
+from app.datamodel.database import engine
+from app.scripts.executors import inference_pool
+from app.scripts.lazy_modules import export_module, learning_module
+from app.scripts.model_registry import model_registry
+from app.scripts.version_registry import version_registry
+
+logger = getLogger(__name__)
+
+
+class Readiness:
+    """Startup steps that have to complete before the service takes traffic."""
+
+    def __init__(self, steps: List[str]):
+        self._steps = {step: False for step in steps}
+        self._errors: Dict[str, str] = {}
+        self._started_at = time.monotonic()
+        self._ready_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return all(self._steps.values())
+
+    def complete(self, step: str) -> None:
+        self._steps[step] = True
+        self._errors.pop(step, None)
+        if self.ready and self._ready_at is None:
+            self._ready_at = time.monotonic()
+            logger.info(
+                "Service ready after %.2f s.", self._ready_at - self._started_at
+            )
+
+    def fail(self, step: str, error: str) -> None:
+        self._errors[step] = error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "steps": dict(self._steps),
+            "errors": dict(self._errors),
+            "ready_seconds": (
+                self._ready_at - self._started_at if self._ready_at else None
+            ),
+        }
+
+
+def preload_models(count: int) -> None:
+    """Load the most recent model versions into the registry."""
+    with Session(engine) as db:
+        model_registry.preload(db, count)
+
+
+readiness = Readiness(
+    [StartupStep.DATABASE, StartupStep.MODEL_VERSIONS, StartupStep.MODELS]
+)
+
+
+class Warmup:
+    """Import the modelling modules and warm up model versions in the background.
+
+    The most recent ``preload_count`` versions and the listed ``versions`` are
+    loaded, which runs dummy batches through them. The service starts
+    answering requests right away, and reports ready once the warmup completed.
+    A listed version that fails to load is retried ``attempts`` times with
+    doubling delays, then reported as an error without holding back readiness.
+    """
+
+    def __init__(
+        self,
+        preload_count: int,
+        versions: List[str],
+        attempts: int,
+        retry_interval: float,
+    ):
+        self.preload_count = preload_count
+        self.versions = versions
+        self.attempts = attempts
+        self.retry_interval = retry_interval
+
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        try:
+            await learning_module.aload()
+            await export_module.aload()
+            await inference_pool.run(preload_models, self.preload_count)
+        except Exception as ex:
+            logger.exception("Model warmup failed.")
+            readiness.fail(StartupStep.MODELS, str(ex))
+            return
+
+        errors = []
+        for version in self.versions:
+            error = await self._warm_up_version(version)
+            if error is not None:
+                errors.append(error)
+        readiness.complete(StartupStep.MODELS)
+        if errors:
+            readiness.fail(StartupStep.MODELS, " ".join(errors))
+
+    async def _warm_up_version(self, version: str) -> Optional[str]:
+        """Load a version, retrying with backoff, and return the last error."""
+        delay = self.retry_interval
+        for attempt in range(1, self.attempts + 1):
+            try:
+                model_version = await version_registry.get(version)
+                if model_version is None:
+                    raise ValueError(
+                        ResponseMessage.MODEL_DOESNT_EXIST.value.format(
+                            model_version=version
+                        )
+                    )
+                await inference_pool.run(
+                    model_registry.get, model_version.image_model_uuid
+                )
+                return None
+            except Exception as ex:
+                if attempt == self.attempts:
+                    logger.exception(
+                        "Warmup of model version %s failed, not waiting for it.",
+                        version,
+                    )
+                    return str(ex)
+                logger.warning(
+                    "Warmup of model version %s failed (attempt %d of %d), "
+                    "retrying in %.0f s: %s",
+                    version,
+                    attempt,
+                    self.attempts,
+                    delay,
+                    ex,
+                )
+            await asyncio.sleep(delay)
+            delay *= 2
+        return None
+
+
+warmup = Warmup(
+    preload_count=settings.model_cache_preload,
+    versions=settings.warmup_versions,
+    attempts=settings.warmup_attempts,
+    retry_interval=settings.warmup_retry_seconds,
+)
@@ -0,0 +1,159 @@
+"""Provider of the pretrained backbone weights."""
+
+import hashlib
+import os
+from logging import getLogger
+from os import path
+from threading import Lock
+from typing import Any, List, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.constants import APIConstants, ModelConstants
+from app.utils import download_data, file_lock
+
+logger = getLogger(__name__)
+
+
+class WeightsIntegrityError(ValueError):
+    """Weights file does not match its expected checksum."""
+
+
+def file_digest(file_path: str, algorithm: str = "sha256") -> str:
+    """Return the hex digest of a file."""
+    digest = hashlib.new(algorithm)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(APIConstants.UPLOAD_CHUNK_SIZE.value), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class WeightsProvider:
+    """Download, verify and cache a pretrained weights file.
+
+    A file in ``seed_dir`` is used as is, which lets offline machines run
+    from pre-seeded weights. Otherwise the file is downloaded once into
+    ``cache_dir`` under a lock shared by all processes. Files are checked
+    against the published ``sha256`` and ``md5`` digests that are given, and a
+    cached download against the sha256 recorded once it passed those checks.
+    Weights loaded into a model are kept in memory, so later models of the
+    same architecture skip reading the file.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        cache_dir: str,
+        seed_dir: Optional[str] = None,
+        sha256: Optional[str] = None,
+        md5: Optional[str] = None,
+    ):
+        self.url = url
+        self.filename = path.basename(url)
+        self.cache_dir = cache_dir
+        self.seed_dir = seed_dir
+        self.sha256 = sha256
+        self.md5 = md5
+
+        self._weights: Optional[List[np.ndarray]] = None
+        self._lock = Lock()
+
+        self.downloads = 0
+        self.loads = 0
+
+    def _verify(
+        self, file_path: str, sha256: Optional[str], md5: Optional[str] = None
+    ) -> bool:
+        for algorithm, expected in (("sha256", sha256), ("md5", md5)):
+            if expected is None:
+                continue
+
+            actual = file_digest(file_path, algorithm)
+            if actual != expected:
+                logger.warning(
+                    "Checksum mismatch for %s, expected %s %s got %s.",
+                    file_path,
+                    algorithm,
+                    expected,
+                    actual,
+                )
+                return False
+
+        return True
+
+    def _recorded_sha256(self, file_path: str) -> Optional[str]:
+        checksum_path = f"{file_path}.sha256"
+        if not path.isfile(checksum_path):
+            return None
+
+        with open(checksum_path) as f:
+            return f.read().strip()
+
+    def _download(self, target_file: str) -> None:
+        logger.info("Downloading pretrained weights from %s.", self.url)
+        digest = download_data(self.url, target_file)
+        self.downloads += 1
+
+        if self.sha256 is not None and digest != self.sha256:
+            os.remove(target_file)
+            raise WeightsIntegrityError(
+                f"Checksum mismatch for {self.url}, expected {self.sha256} got {digest}."
+            )
+        if not self._verify(target_file, None, self.md5):
+            os.remove(target_file)
+            raise WeightsIntegrityError(f"Checksum mismatch for {self.url}.")
+
+        with open(f"{target_file}.sha256", "w") as f:
+            f.write(digest)
+
+    def fetch(self) -> str:
+        """Return the path of a verified weights file, downloading it if needed."""
+        if self.seed_dir is not None:
+            seed_file = path.join(self.seed_dir, self.filename)
+            if path.isfile(seed_file):
+                if not self._verify(seed_file, self.sha256, self.md5):
+                    raise WeightsIntegrityError(f"Corrupt seeded weights {seed_file}.")
+                return seed_file
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        target_file = path.join(self.cache_dir, self.filename)
+
+        with file_lock(f"{target_file}.lock"):
+            # Files without a recorded digest predate it or come from an
+            # interrupted download, and are fetched again.
+            expected = self.sha256 or self._recorded_sha256(target_file)
+            if (
+                not path.isfile(target_file)
+                or expected is None
+                or not self._verify(target_file, expected)
+            ):
+                self._download(target_file)
+
+        return target_file
+
+    def load_into(self, model: Any) -> None:
+        """Set the pretrained weights of a freshly built model."""
+        with self._lock:
+            if self._weights is None:
+                model.load_weights(self.fetch())
+                self._weights = model.get_weights()
+                self.loads += 1
+                return
+
+        model.set_weights(self._weights)
+
+    def clear(self) -> None:
+        """Drop the weights held in memory."""
+        with self._lock:
+            self._weights = None
+
+
+pretrained_weights = WeightsProvider(
+    url=ModelConstants.PRETRAINED_WEIGHTS.value,
+    cache_dir=str(settings.data_dir),
+    seed_dir=settings.pretrained_weights_dir,
+    sha256=settings.pretrained_weights_sha256,
+    md5=settings.pretrained_weights_md5,
+)
@@ -1,36 +1,153 @@
 """Utility functions."""
 
+import fcntl
+import hashlib
+import os
 import zipfile
+from contextlib import contextmanager
+from itertools import islice
 from os import path
+from pathlib import PurePosixPath
+from typing import IO, Dict, Iterable, Iterator, List, Tuple, Union
 
 import requests
 
 from app.config import settings
-from app.constants import ModelConstants
+from app.constants import APIConstants, ModelConstants
 
 
-def download_data(filename: str) -> str:
-    """Download given file to data dir"""
-    target_file = path.join(settings.data_dir, filename)
-    if path.isfile(target_file):
-        print("file already exists!")
-        return target_file
+@contextmanager
+def file_lock(lock_path: str) -> Iterator[None]:
+    """Hold an exclusive lock on a file, shared by all processes on the host."""
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
-    file_to_download = requests.get(
-        ModelConstants.PRETRAINED_WEIGHTS.value, stream=True
-    )
 
-    with open(target_file, "wb") as file:
-        for chunk in file_to_download.iter_content(chunk_size=1024):
-            if chunk:
+def download_data(url: str, target_file: str) -> str:
+    """Download a url to the target file and return its sha256 hex digest.
+
+    The file is written to a temporary path and renamed once complete, so an
+    interrupted download never leaves a partial file behind.
+    """
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+
+    digest = hashlib.sha256()
+    tmp_file = f"{target_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "wb") as file:
+            for chunk in response.iter_content(
+                chunk_size=APIConstants.UPLOAD_CHUNK_SIZE.value
+            ):
                 file.write(chunk)
+                digest.update(chunk)
+
+        expected_size = response.headers.get("Content-Length")
+        if expected_size is not None and path.getsize(tmp_file) != int(expected_size):
+            raise IOError(f"Incomplete download of {url}.")
+
+        os.replace(tmp_file, target_file)
+    finally:
+        if path.exists(tmp_file):
+            os.remove(tmp_file)
+
+    return digest.hexdigest()
+
+
+class ZipLimitError(ValueError):
+    """Archive exceeds the configured ingestion limits."""
+
+
+def check_zip_limits(zip_ref: zipfile.ZipFile) -> None:
+    """Guard against zip bombs before reading any member."""
+    members = zip_ref.infolist()
+    if len(members) > settings.max_zip_members:
+        raise ZipLimitError(
+            f"Archive has {len(members)} members, "
+            f"the limit is {settings.max_zip_members}."
+        )
+
+    total_size = sum(member.file_size for member in members)
+    if total_size > settings.max_zip_uncompressed_bytes:
+        raise ZipLimitError(
+            f"Archive expands to {total_size} bytes, "
+            f"the limit is {settings.max_zip_uncompressed_bytes}."
+        )
+
+    for member in members:
+        if member.file_size > settings.max_zip_compression_ratio * max(
+            member.compress_size, 1
+        ):
+            raise ZipLimitError(
+                f"Member {member.filename} exceeds the compression ratio limit."
+            )
+
 
-    return target_file
+def validate_zip(source: Union[str, IO[bytes]]) -> None:
+    """Open an archive and check it against the ingestion limits."""
+    with zipfile.ZipFile(source, "r") as zip_ref:
+        check_zip_limits(zip_ref)
+
+
+def list_zip_images(zip_ref: zipfile.ZipFile) -> Tuple[List[str], List[int], Dict]:
+    """List image members in class folders, labelled like flow_from_directory.
+
+    A single top level folder wrapping the class folders is skipped, as
+    unzip_data callers expect the archive to contain one.
+    """
+    names = sorted(
+        member.filename
+        for member in zip_ref.infolist()
+        if not member.is_dir()
+        and not member.filename.startswith("__MACOSX/")
+        and member.filename.lower().endswith(ModelConstants.IMAGE_EXTENSIONS.value)
+    )
+    parts = [PurePosixPath(name).parts for name in names]
+    offset = int(
+        bool(parts)
+        and len({part[0] for part in parts}) == 1
+        and all(len(part) > 2 for part in parts)
+    )
+
+    labelled = [
+        (name, part[offset])
+        for name, part in zip(names, parts)
+        if len(part) > offset + 1
+    ]
+    classes = sorted({class_name for _, class_name in labelled})
+    class_indices = {class_name: idx for idx, class_name in enumerate(classes)}
+
+    return (
+        [name for name, _ in labelled],
+        [class_indices[class_name] for _, class_name in labelled],
+        class_indices,
+    )
 
 
 def unzip_data(file_path: str) -> str:
-    """Unzip given filename to data dir."""
+    """Unzip given filename next to the archive."""
     with zipfile.ZipFile(file_path, "r") as zip_ref:
-        zip_ref.extractall(settings.data_dir)
+        check_zip_limits(zip_ref)
+        zip_ref.extractall(path.dirname(file_path))
 
     return file_path[:-4]
+
+
+def iter_image_files(directory: str) -> Iterator[str]:
+    """Lazily yield image files below a directory in a stable order."""
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        for name in sorted(names):
+            if name.lower().endswith(ModelConstants.IMAGE_EXTENSIONS.value):
+                yield path.join(root, name)
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    """Split an iterable into lists of at most size items."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
@@ -0,0 +1,157 @@
+"""Time the hot history and model lookup queries with and without indexes.
+
+Seeds a model version and ``--rows`` predict operations spread over a year,
+then runs each query ``--repeat`` times. The "before" timings drop the
+indexes added by migration 0001 inside a transaction that is rolled back, so
+the seeded database is left as it was.
+
+Usage: python -m benchmarks.history_queries [--rows N] [--repeat N] [--keep]
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Callable, Dict, List
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.datamodel.database import engine
+from app.datamodel.models import Base
+from app.scripts.async_db_scripts import history_query
+
+VERSION = "benchmark-history"
+INDEXES = [
+    "ix_operation_time_operation_uuid",
+    "ix_operation_model_uuid_time",
+    "ix_predict_operation_uuid",
+    "ix_evaluate_operation_uuid",
+]
+
+
+def seed(connection: Connection, rows: int) -> UUID:
+    """Insert a model version and its predict history."""
+    model_uuid = connection.execute(
+        text(
+            "INSERT INTO image_model (version, class_map) "
+            "VALUES (:version, CAST(:class_map AS jsonb)) "
+            "RETURNING image_model_uuid"
+        ),
+        dict(version=VERSION, class_map=json.dumps({"cat": 0, "dog": 1})),
+    ).scalar_one()
+
+    connection.execute(
+        text(
+            "INSERT INTO operation (operation_uuid, name, time, model_uuid) "
+            "SELECT uuid_generate_v4(), 'predict', "
+            "now() - make_interval(secs => random() * 31536000), :model_uuid "
+            "FROM generate_series(1, :rows)"
+        ),
+        dict(model_uuid=model_uuid, rows=rows),
+    )
+    connection.execute(
+        text(
+            "INSERT INTO predict (data, output, operation_uuid) "
+            "SELECT 'image.jpg', 'cat', operation_uuid FROM operation "
+            "WHERE model_uuid = :model_uuid"
+        ),
+        dict(model_uuid=model_uuid),
+    )
+    connection.execute(text("ANALYZE operation; ANALYZE predict"))
+
+    return model_uuid
+
+
+def clean(connection: Connection, model_uuid: UUID) -> None:
+    connection.execute(
+        text(
+            "DELETE FROM predict USING operation "
+            "WHERE predict.operation_uuid = operation.operation_uuid "
+            "AND operation.model_uuid = :model_uuid"
+        ),
+        dict(model_uuid=model_uuid),
+    )
+    connection.execute(
+        text("DELETE FROM operation WHERE model_uuid = :model_uuid"),
+        dict(model_uuid=model_uuid),
+    )
+    connection.execute(
+        text("DELETE FROM image_model WHERE image_model_uuid = :model_uuid"),
+        dict(model_uuid=model_uuid),
+    )
+
+
+def queries(connection: Connection, model_uuid: UUID) -> Dict[str, Callable]:
+    """Queries run by /history, /predict and /evaluate."""
+    first_page = connection.execute(history_query().limit(100)).all()
+    after = (first_page[-1].time, first_page[-1].operation_uuid)
+
+    return {
+        "history first page": lambda: connection.execute(
+            history_query().limit(100)
+        ).all(),
+        "history next page": lambda: connection.execute(
+            history_query(after=after).limit(100)
+        ).all(),
+        "history by model": lambda: connection.execute(
+            history_query(model_uuid=model_uuid).limit(100)
+        ).all(),
+        "model id by version": lambda: connection.execute(
+            text("SELECT image_model_uuid FROM image_model WHERE version = :version"),
+            dict(version=VERSION),
+        ).one(),
+        "class map": lambda: connection.execute(
+            text(
+                "SELECT class_map FROM image_model "
+                "WHERE image_model_uuid = :model_uuid"
+            ),
+            dict(model_uuid=model_uuid),
+        ).one(),
+    }
+
+
+def timings(run: Dict[str, Callable], repeat: int) -> Dict[str, float]:
+    """Median time of each query in milliseconds."""
+    result = {}
+    for name, query in run.items():
+        elapsed: List[float] = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            elapsed.append((time.perf_counter() - start) * 1000)
+        result[name] = statistics.median(elapsed)
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Keep the seeded rows")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        model_uuid = seed(connection, args.rows)
+
+    try:
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            for index in INDEXES:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+            before = timings(queries(connection, model_uuid), args.repeat)
+            transaction.rollback()
+
+        with engine.connect() as connection:
+            after = timings(queries(connection, model_uuid), args.repeat)
+    finally:
+        if not args.keep:
+            with engine.begin() as connection:
+                clean(connection, model_uuid)
+
+    print(f"{'query':<22}{'before ms':>12}{'after ms':>12}")
+    for name in before:
+        print(f"{name:<22}{before[name]:>12.2f}{after[name]:>12.2f}")
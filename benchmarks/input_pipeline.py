@@ -0,0 +1,36 @@
+"""Compare throughput of the ImageDataGenerator and tf.data input pipelines.
+
+Usage: python -m benchmarks.input_pipeline <class directory> [--batches N]
+"""
+
+import argparse
+import time
+
+from app.constants import InputPipeline
+from app.scripts.learning import load_dataset
+
+
+def measure(data_dir: str, pipeline: str, batches: int) -> float:
+    """Return images per second over the given number of training batches."""
+    data, _ = load_dataset(data_dir, augment=True, repeat=True, pipeline=pipeline)
+    iterator = iter(data)
+    next(iterator)  # exclude pipeline start-up
+
+    images = 0
+    start = time.perf_counter()
+    for _ in range(batches):
+        img, _ = next(iterator)
+        images += len(img)
+
+    return images / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("data_dir")
+    parser.add_argument("--batches", type=int, default=50)
+    args = parser.parse_args()
+
+    for pipeline in (InputPipeline.GENERATOR, InputPipeline.TF_DATA):
+        rate = measure(args.data_dir, pipeline, args.batches)
+        print(f"{pipeline:>10}: {rate:8.1f} images/s")
@@ -0,0 +1,94 @@
+"""Compare size, load latency and predict latency of a model's serving artifacts.
+
+Usage: python -m benchmarks.serving_artifacts <model uuid> [--loads N] [--batch N]
+"""
+
+import argparse
+import os
+import time
+from os import path
+from typing import Any, Callable
+from uuid import UUID
+
+import numpy as np
+
+from app.config import settings
+from app.constants import ModelConstants
+from app.scripts.export import get_tflite_path
+from app.scripts.learning import (
+    TFLiteModel,
+    get_frozen_path,
+    load_frozen_model,
+    load_model,
+)
+
+
+def disk_bytes(artifact_path: str) -> int:
+    """Size of a file or of all files below a directory."""
+    if path.isfile(artifact_path):
+        return path.getsize(artifact_path)
+
+    return sum(
+        path.getsize(path.join(root, name))
+        for root, _, names in os.walk(artifact_path)
+        for name in names
+    )
+
+
+def measure(loader: Callable[[], Any], loads: int, batch: np.ndarray) -> tuple:
+    """Return mean load seconds, first predict seconds and steady predict seconds."""
+    load_time = 0.0
+    for _ in range(loads):
+        start = time.perf_counter()
+        model = loader()
+        load_time += time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.predict(batch, verbose=0)
+    first_predict = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.predict(batch, verbose=0)
+    predict = time.perf_counter() - start
+
+    return load_time / loads, first_predict, predict
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("model_id", type=UUID)
+    parser.add_argument("--loads", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=16)
+    args = parser.parse_args()
+
+    artifacts = {
+        "savedmodel": (
+            path.join(settings.data_dir, str(args.model_id)),
+            lambda: load_model(args.model_id),
+        ),
+        "frozen": (
+            get_frozen_path(args.model_id),
+            lambda: load_frozen_model(args.model_id),
+        ),
+        "tflite": (
+            get_tflite_path(args.model_id),
+            lambda: TFLiteModel(
+                get_tflite_path(args.model_id), settings.warmup_batch_sizes
+            ),
+        ),
+    }
+    batch = np.random.rand(args.batch, *ModelConstants.INPUT_IMAGE_SHAPE.value).astype(
+        np.float32
+    )
+
+    print(f"{'artifact':>10} {'MB':>8} {'load s':>8} {'1st pred s':>10} {'pred s':>8}")
+    for name, (artifact_path, loader) in artifacts.items():
+        if not path.exists(artifact_path):
+            print(f"{name:>10}  missing")
+            continue
+
+        size = disk_bytes(artifact_path) / 1024**2
+        load, first_predict, predict = measure(loader, args.loads, batch)
+        print(
+            f"{name:>10} {size:8.1f} {load:8.2f} {first_predict:10.3f} {predict:8.3f}"
+        )
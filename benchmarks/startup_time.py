@@ -0,0 +1,81 @@
+"""Measure how long a fresh worker takes to start serving.
+
+Times the import of ``app.main`` in a clean interpreter, then starts uvicorn
+and polls until /metadata answers and until /ready reports the models warm.
+Uses the database settings of the environment.
+
+Usage: python -m benchmarks.startup_time [--port N] [--timeout S]
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Optional
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import app.main
+print(time.perf_counter() - start, "tensorflow" in sys.modules)
+"""
+
+
+def import_time() -> str:
+    """Import app.main in a clean interpreter, return the time and TF state."""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    return f"{float(output[0]):.2f} s, tensorflow imported: {output[1]}"
+
+
+def status(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as ex:
+        return ex.code
+    except OSError:
+        return None
+
+
+def serve_time(port: int, timeout: float) -> dict:
+    """Start uvicorn and record when each endpoint first answers 200."""
+    base_url = f"http://127.0.0.1:{port}"
+    pending = {"metadata": f"{base_url}/metadata", "ready": f"{base_url}/ready"}
+    elapsed = {}
+
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while pending and time.perf_counter() - start < timeout:
+            for name, url in list(pending.items()):
+                if status(url) == 200:
+                    elapsed[name] = time.perf_counter() - start
+                    del pending[name]
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    print(f"import app.main: {import_time()}")
+    for name, seconds in serve_time(args.port, args.timeout).items():
+        print(f"first 200 from /{name}: {seconds:.2f} s")
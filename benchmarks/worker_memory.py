@@ -0,0 +1,89 @@
+"""Measure memory per worker process serving several model versions.
+
+Each worker loads the given versions through the serving loader and runs a
+prediction with each, as a uvicorn worker would. RSS counts shared pages in
+every process, while PSS splits them between the processes mapping them.
+
+Usage: python -m benchmarks.worker_memory <model uuid>... [--workers N] [--mmap]
+"""
+
+import argparse
+import multiprocessing
+import os
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+from app.constants import ModelConstants
+
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    """Return RSS and PSS of a process in kB, read from /proc."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(rest.split()[0])
+
+    return values
+
+
+def serve(model_ids: List[str], mmap: bool, ready, done) -> None:
+    os.environ["MMAP_WEIGHTS"] = str(mmap)
+    from app.scripts.export import load_serving_model
+
+    batch = np.random.rand(1, *ModelConstants.INPUT_IMAGE_SHAPE.value).astype(
+        np.float32
+    )
+    loaded = [load_serving_model(model_id) for model_id in model_ids]
+    for model in loaded:
+        model.predict(batch, verbose=0)
+
+    ready.wait()
+    done.wait()
+
+
+def measure(
+    model_ids: List[str], workers: int, mmap: bool, timeout: float
+) -> List[Dict[str, int]]:
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(workers + 1)
+    done = context.Event()
+    processes = [
+        context.Process(target=serve, args=(model_ids, mmap, ready, done))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        ready.wait(timeout)
+    except threading.BrokenBarrierError:
+        for process in processes:
+            process.terminate()
+        raise RuntimeError("Workers did not load the models, check they fit in memory.")
+
+    usage = [memory_kb(process.pid) for process in processes]
+
+    done.set()
+    for process in processes:
+        process.join()
+
+    return usage
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("model_ids", nargs="+")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mmap", action="store_true")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    for workers in sorted({1, args.workers}):
+        usage = measure(args.model_ids, workers, args.mmap, args.timeout)
+        rss = sum(row["Rss"] for row in usage) / len(usage) / 1024
+        pss = sum(row["Pss"] for row in usage) / len(usage) / 1024
+        print(f"{workers:>3} workers: {rss:8.1f} MB RSS, {pss:8.1f} MB PSS per worker")
@@ -1,3 +1,4 @@
+import argparse
 from os import environ
 
 import uvicorn
@@ -13,12 +14,32 @@ def load_env_variables() -> None:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, more than one disables auto reload.",
+    )
+    args = parser.parse_args()
+
     load_env_variables()
 
-    uvicorn.run(
-        app="app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        debug=True,
-    )
+    if args.workers > 1:
+        # Workers share model weights through read-only mapped files
+        environ.setdefault("MMAP_WEIGHTS", "true")
+        uvicorn.run(
+            app="app.main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=args.workers,
+        )
+    else:
+        environ.setdefault("DEBUG_TIMING_HEADER", "true")
+        uvicorn.run(
+            app="app.main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            debug=True,
+        )
@@ -0,0 +1,90 @@
+"""Baseline
+
+Create the image_model, operation, predict and evaluate tables as the
+service created them before the schema migrations.
+
+Databases set up by ``setup_db`` already have these tables, so each table is
+only created when it is missing.
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import UUID
+
+# revision identifiers, used by Alembic.
+revision = "0000"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def uuid_column(name: str) -> sa.Column:
+    return sa.Column(
+        name,
+        UUID(as_uuid=True),
+        primary_key=True,
+        server_default=sa.text("uuid_generate_v4()"),
+    )
+
+
+def created_at_column(name: str) -> sa.Column:
+    return sa.Column(
+        name,
+        sa.DateTime(),
+        server_default=sa.func.timezone("UTC", sa.func.current_timestamp()),
+        nullable=False,
+    )
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"')
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "image_model" not in tables:
+        op.create_table(
+            "image_model",
+            uuid_column("image_model_uuid"),
+            sa.Column("version", sa.String(), nullable=False, unique=True),
+            sa.Column("class_map", sa.String(), nullable=False),
+            created_at_column("created_at"),
+        )
+
+    if "operation" not in tables:
+        op.create_table(
+            "operation",
+            uuid_column("operation_uuid"),
+            sa.Column("name", sa.String(), nullable=False),
+            created_at_column("time"),
+            sa.Column(
+                "model_uuid",
+                UUID(as_uuid=True),
+                sa.ForeignKey("image_model.image_model_uuid"),
+                nullable=False,
+            ),
+        )
+
+    for table in ("predict", "evaluate"):
+        if table in tables:
+            continue
+        metrics = [sa.Column("metrics", sa.String())] if table == "evaluate" else []
+        op.create_table(
+            table,
+            uuid_column(f"{table}_uuid"),
+            sa.Column("data", sa.String()),
+            sa.Column("output", sa.String(), nullable=False),
+            *metrics,
+            sa.Column(
+                "operation_uuid",
+                UUID(as_uuid=True),
+                sa.ForeignKey("operation.operation_uuid"),
+                nullable=False,
+            ),
+        )
+
+
+def downgrade() -> None:
+    for table in ("evaluate", "predict", "operation", "image_model"):
+        op.drop_table(table)
@@ -0,0 +1,109 @@
+"""History indexes and typed columns
+
+Index the operation lookups used by /history and the joins to predict and
+evaluate, store image_model.class_map and evaluate.metrics as JSONB and add
+numeric evaluate.accuracy and evaluate.loss columns.
+
+Databases created by ``setup_db`` after this revision already have the new
+schema, so every step checks the current state first.
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import JSONB
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = "0000"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("operation", "ix_operation_time_operation_uuid", ["time", "operation_uuid"]),
+    ("operation", "ix_operation_model_uuid_time", ["model_uuid", "time"]),
+    ("predict", "ix_predict_operation_uuid", ["operation_uuid"]),
+    ("evaluate", "ix_evaluate_operation_uuid", ["operation_uuid"]),
+]
+
+NUMBER_PATTERN = r"^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$"
+
+
+def get_columns(table: str) -> dict:
+    inspector = sa.inspect(op.get_bind())
+    return {column["name"]: column["type"] for column in inspector.get_columns(table)}
+
+
+def get_indexes(table: str) -> set:
+    inspector = sa.inspect(op.get_bind())
+    return {index["name"] for index in inspector.get_indexes(table)}
+
+
+def upgrade() -> None:
+    # Build indexes without blocking writes to the history tables
+    with op.get_context().autocommit_block():
+        for table, name, columns in INDEXES:
+            if name not in get_indexes(table):
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+
+    if not isinstance(get_columns("image_model")["class_map"], JSONB):
+        op.alter_column(
+            "image_model",
+            "class_map",
+            type_=JSONB,
+            postgresql_using="class_map::jsonb",
+        )
+
+    evaluate_columns = get_columns("evaluate")
+    for column in ("accuracy", "loss"):
+        if column not in evaluate_columns:
+            op.add_column("evaluate", sa.Column(column, sa.Float()))
+
+    if not isinstance(evaluate_columns["metrics"], JSONB):
+        # Metrics used to be either the bare loss or a JSON object of metrics
+        # including the loss.
+        op.execute(
+            f"""
+            UPDATE evaluate SET
+                accuracy = CASE WHEN output ~ '{NUMBER_PATTERN}'
+                    THEN output::double precision END,
+                loss = CASE
+                    WHEN metrics ~ '{NUMBER_PATTERN}'
+                        THEN metrics::double precision
+                    WHEN metrics LIKE '{{%'
+                        THEN (metrics::jsonb ->> 'loss')::double precision
+                END
+            """
+        )
+        op.alter_column(
+            "evaluate",
+            "metrics",
+            type_=JSONB,
+            postgresql_using=(
+                "CASE WHEN metrics LIKE '{%' THEN metrics::jsonb - 'loss' END"
+            ),
+        )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        "evaluate",
+        "metrics",
+        type_=sa.String(),
+        postgresql_using="(metrics || jsonb_build_object('loss', loss))::text",
+    )
+    op.drop_column("evaluate", "loss")
+    op.drop_column("evaluate", "accuracy")
+
+    op.alter_column(
+        "image_model",
+        "class_map",
+        type_=sa.String(),
+        postgresql_using="class_map::text",
+    )
+
+    with op.get_context().autocommit_block():
+        for table, name, _ in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
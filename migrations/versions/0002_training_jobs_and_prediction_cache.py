@@ -0,0 +1,74 @@
+"""Training jobs and prediction cache
+
+Create the training_job table of the background training queue and the
+prediction_cache table of persisted prediction results.
+
+Databases created by ``setup_db`` after this revision already have the
+tables, so each table is only created when it is missing.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import UUID
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def created_at_column() -> sa.Column:
+    return sa.Column(
+        "created_at",
+        sa.DateTime(),
+        server_default=sa.func.timezone("UTC", sa.func.current_timestamp()),
+        nullable=False,
+    )
+
+
+def upgrade() -> None:
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "training_job" not in tables:
+        op.create_table(
+            "training_job",
+            sa.Column(
+                "job_uuid",
+                UUID(as_uuid=True),
+                primary_key=True,
+                server_default=sa.text("uuid_generate_v4()"),
+            ),
+            sa.Column("model_version", sa.String(), nullable=False),
+            sa.Column("model_uuid", UUID(as_uuid=True), nullable=False),
+            sa.Column("data", sa.String(), nullable=False),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("epoch", sa.Integer()),
+            sa.Column("step", sa.Integer()),
+            sa.Column("loss", sa.Float()),
+            sa.Column("error", sa.String()),
+            created_at_column(),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+
+    if "prediction_cache" not in tables:
+        op.create_table(
+            "prediction_cache",
+            sa.Column(
+                "model_uuid",
+                UUID(as_uuid=True),
+                sa.ForeignKey("image_model.image_model_uuid", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            sa.Column("image_hash", sa.String(), primary_key=True),
+            sa.Column("output", sa.String(), nullable=False),
+            created_at_column(),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("prediction_cache")
+    op.drop_table("training_job")